@@ -0,0 +1,157 @@
+""" BOM Batch Module
+
+Runs the BOM Creator over many PDM CSV files across a pool of processes. The Odoo PO data is loaded once and handed
+to each worker process when it starts, instead of once per file.
+
+    Typical usage example:
+    python bom_batch.py --dir "C:/PDM Exports" --output-dir "C:/BOMs" --workers 4
+"""
+
+import argparse
+import glob
+import os
+import time
+import traceback
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+import bom_creator
+import dfexporter
+import instrument
+import odooloader
+
+# BOMCreator methods run for each file, in order. Sheets that prompt the user are left out.
+BATCH_SHEETS = ['add_assy_bom_sheet',
+                'add_schedule_bom_sheet',
+                'add_drawing_list_sheet',
+                'add_mnp_sheet',
+                'add_odoo_po_data_sheet']
+
+# PO data for the worker process, set once when the worker starts by _init_worker
+_worker_odoo_po_df = None
+
+
+def _init_worker(odoo_po_df):
+    global _worker_odoo_po_df
+    _worker_odoo_po_df = odoo_po_df
+
+
+def process_file(csv_file_path, output_dir=None, use_cache=True, profile=False, output_format='xlsx',
+                 streaming=False):
+    """ Create the Excel BOM for one CSV file. Returns a result dict with timing and error (if any).
+
+    With output_format other than xlsx, the sheets are written as plain data files instead, see BOMCreator.
+
+    With streaming=True, the CSV is read in chunks keeping only the BOM columns, see BOMCreator.
+
+    With profile=True, a JSON report with the time and memory of each stage is written next to the Excel file.
+    """
+
+    start_time = time.perf_counter()
+    result = {'File': csv_file_path, 'Output': None, 'Status': 'OK', 'Seconds': None, 'Error': None}
+
+    if profile:
+        instrument.enable()
+
+    try:
+        bom = bom_creator.BOMCreator(csv_file_path=csv_file_path, export_dir=output_dir, use_cache=use_cache,
+                                     odoo_po_df=_worker_odoo_po_df, output_format=output_format,
+                                     streaming=streaming)
+        result['Output'] = bom.excel_export.output_file_name
+
+        for sheet_method in BATCH_SHEETS:
+            getattr(bom, sheet_method)()
+        bom.write_book()
+
+    except Exception as e:
+        result['Status'] = 'FAILED'
+        result['Error'] = f'{type(e).__name__}: {e}'
+        traceback.print_exc()
+
+    if profile:
+        instrument.disable()
+        if result['Output']:
+            instrument.write_report(f"{os.path.splitext(result['Output'])[0]}.profile.json")
+
+    result['Seconds'] = round(time.perf_counter() - start_time, 3)
+    return result
+
+
+def run_batch(csv_files, output_dir=None, workers=None, use_cache=True, odoo_po_df=None, profile=False,
+              output_format='xlsx', streaming=False):
+    """ Process list of CSV files across a process pool. A failed file doesn't stop the rest of the batch.
+
+    Args:
+        csv_files (list): File paths of PDM CSV BOMs
+        output_dir (str, optional): Directory for the Excel files. Defaults to the current directory.
+        workers (int, optional): Number of worker processes. Defaults to the number of CPUs.
+        use_cache (bool, optional): Use cached processed BOMs, see BOMCreator
+        odoo_po_df (DataFrame, optional): Odoo PO line data. If none given, it is fetched once from Odoo.
+        profile (bool, optional): Write a timing and memory report next to each Excel file, see process_file
+        output_format (str, optional): xlsx, or parquet, feather or csv for plain data files, see BOMCreator
+        streaming (bool, optional): Read the CSVs in chunks keeping only the BOM columns, see BOMCreator
+
+    Returns:
+        DataFrame: One row per file with output file, status, run time in seconds and error
+    """
+
+    if odoo_po_df is None:
+        odoo_po_df = odooloader.OdooLoader().get_po_lines_df()
+
+    if output_dir and not os.path.exists(output_dir):
+        os.makedirs(output_dir)
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(odoo_po_df,)) as pool:
+        futures = {pool.submit(process_file, csv_file, output_dir, use_cache, profile, output_format, streaming):
+                   csv_file
+                   for csv_file in csv_files}
+
+        for future in as_completed(futures):
+            try:
+                result = future.result()
+            except Exception as e:
+                # Worker process died (ex. out of memory)
+                result = {'File': futures[future], 'Output': None, 'Status': 'FAILED', 'Seconds': None,
+                          'Error': f'{type(e).__name__}: {e}'}
+
+            print(f"{result['Status']:6} {result['Seconds']}s {result['File']}")
+            results.append(result)
+
+    return pd.DataFrame(results).sort_values('File').reset_index(drop=True)
+
+
+def find_csv_files(paths):
+    """ Expand list of files and directories into a list of CSV (and JSON) files """
+    csv_files = []
+    for path in paths:
+        if os.path.isdir(path):
+            csv_files.extend(sorted(glob.glob(os.path.join(path, '*.csv')) + glob.glob(os.path.join(path, '*.json'))))
+        else:
+            csv_files.append(path)
+    return csv_files
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Process a batch of PDM CSV BOM files')
+    parser.add_argument('paths', nargs='*', help='CSV files to process')
+    parser.add_argument('--dir', action='append', default=[], help='Directory of CSV files to process')
+    parser.add_argument('--output-dir', default=None)
+    parser.add_argument('--workers', type=int, default=None)
+    parser.add_argument('--no-cache', action='store_true')
+    parser.add_argument('--profile', action='store_true', help='Write a timing report next to each Excel file')
+    parser.add_argument('--output-format', default='xlsx', choices=dfexporter.OUTPUT_FORMATS)
+    parser.add_argument('--streaming', action='store_true', help='Read the CSVs in chunks to use less memory')
+    args = parser.parse_args()
+
+    csv_files = find_csv_files(args.paths + args.dir)
+    results = run_batch(csv_files, output_dir=args.output_dir, workers=args.workers, use_cache=not args.no_cache,
+                        profile=args.profile, output_format=args.output_format, streaming=args.streaming)
+
+    print(results.to_string())
+    failed = results.loc[results['Status'] != 'OK']
+    print(f'{len(results) - len(failed)} of {len(results)} BOMs processed, {len(failed)} failed')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,154 @@
+""" BOM Benchmark Module
+
+Times each processing stage of BOM.load_csv on generated BOMs of increasing size, to see how the processing scales.
+Results are compared to stored baselines and any stage that got slower than the tolerance is flagged.
+
+    Typical usage example:
+    python bom_benchmark.py                       # run and compare to the stored baselines
+    python bom_benchmark.py --sizes 1000 20000    # only some sizes
+    python bom_benchmark.py --save-baseline       # store the results as the new baselines
+"""
+
+import argparse
+import json
+import os
+import platform
+import sys
+import tempfile
+
+import pandas as pd
+import bomgen
+import bomloader
+import instrument
+
+# Instrumented stages of BOM.load_csv that are timed, see instrument.py
+BENCHMARK_STAGES = ['BOM.load_csv',
+                    'BOM.read_csv_file',
+                    'BOM.process_part_numbers',
+                    'BOM.determine_part_type',
+                    'BOM.sort_df',
+                    'BOM.get_used_on',
+                    'BOM.get_total_qty',
+                    'BOM.get_drawings',
+                    'BOM.fix_material']
+
+BENCHMARK_SIZES = [1000, 5000, 20000, 50000, 200000]
+
+BASELINE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'benchmarks', 'baselines.json')
+
+# A stage is flagged if it takes this much longer than its baseline...
+REGRESSION_TOLERANCE = 0.25
+# ...and at least this many seconds longer, so timer noise on tiny stages isn't flagged
+REGRESSION_MIN_SECONDS = 0.005
+
+
+def benchmark_file(csv_file_path, repeat=3):
+    """ Load given CSV file repeat times and return the best time of each stage, in seconds """
+    best = {}
+    for _ in range(repeat):
+        instrument.enable(trace_memory=False)
+        bomloader.BOM().load_csv(csv_file_path)
+        instrument.disable()
+
+        timings = {totals['name']: totals['seconds'] for totals in instrument.get_report()['summary']
+                   if totals['name'] in BENCHMARK_STAGES}
+        best = {stage: min(seconds, best.get(stage, seconds)) for stage, seconds in timings.items()}
+
+    return {stage: best[stage] for stage in BENCHMARK_STAGES if stage in best}
+
+
+def run_benchmarks(sizes=None, repeat=3, generator=None, data_dir=None):
+    """ Generate a BOM of each size and benchmark loading it
+
+    Args:
+        sizes (list, optional): Number of BOM lines to benchmark. Defaults to BENCHMARK_SIZES.
+        repeat (int, optional): Loads per size, the best time of each stage is kept
+        generator (BOMGenerator, optional): Generator used for the BOMs. Defaults to the default BOM shape.
+        data_dir (str, optional): Directory for the generated CSV files. Defaults to a temporary directory.
+
+    Returns:
+        dict: {rows: {stage: seconds}}, with rows as a string so it matches the JSON baselines
+    """
+    sizes = sizes or BENCHMARK_SIZES
+    generator = generator or bomgen.BOMGenerator()
+
+    if data_dir and not os.path.exists(data_dir):
+        os.makedirs(data_dir)
+
+    results = {}
+    with tempfile.TemporaryDirectory() as temp_dir:
+        for rows in sizes:
+            csv_file_path = os.path.join(data_dir or temp_dir, f'benchmark_{rows}.csv')
+            if not os.path.exists(csv_file_path):
+                generator.write_csv(csv_file_path, rows=rows)
+
+            results[str(rows)] = benchmark_file(csv_file_path, repeat=repeat)
+            print(f"{rows:>8} rows  {results[str(rows)]['BOM.load_csv']:8.3f}s")
+
+    return results
+
+
+def compare_to_baseline(results, baselines, tolerance=REGRESSION_TOLERANCE):
+    """ Return DataFrame with the time of each size and stage next to its baseline, flagging regressions """
+    rows = []
+    for size, timings in results.items():
+        for stage, seconds in timings.items():
+            baseline = baselines.get(size, {}).get(stage)
+            regression = baseline is not None and seconds > baseline * (1 + tolerance) \
+                and seconds - baseline > REGRESSION_MIN_SECONDS
+
+            rows.append({'Rows': int(size),
+                         'Stage': stage,
+                         'Seconds': round(seconds, 4),
+                         'Baseline': None if baseline is None else round(baseline, 4),
+                         'Change': None if not baseline else f'{seconds / baseline - 1:+.0%}',
+                         'Regression': 'YES' if regression else ''})
+    return pd.DataFrame(rows)
+
+
+def load_baselines(file_path=BASELINE_FILE):
+    if not os.path.exists(file_path):
+        return {}
+    with open(file_path) as f:
+        return json.load(f)['results']
+
+
+def save_baselines(results, file_path=BASELINE_FILE):
+    """ Store results as the baselines, with the machine and library versions they were measured on """
+    baseline_dir = os.path.dirname(file_path)
+    if baseline_dir and not os.path.exists(baseline_dir):
+        os.makedirs(baseline_dir)
+
+    with open(file_path, 'w') as f:
+        json.dump({'machine': {'platform': platform.platform(),
+                               'processor': platform.processor(),
+                               'python': platform.python_version(),
+                               'pandas': pd.__version__},
+                   'results': {size: {stage: round(seconds, 5) for stage, seconds in timings.items()}
+                               for size, timings in results.items()}}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark the BOM processing stages on generated BOMs')
+    parser.add_argument('--sizes', type=int, nargs='+', default=BENCHMARK_SIZES)
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--baseline', default=BASELINE_FILE, help='Baseline JSON file')
+    parser.add_argument('--save-baseline', action='store_true', help='Store the results as the new baselines')
+    parser.add_argument('--tolerance', type=float, default=REGRESSION_TOLERANCE)
+    parser.add_argument('--data-dir', default=None, help='Keep the generated CSV files in this directory')
+    args = parser.parse_args()
+
+    results = run_benchmarks(args.sizes, repeat=args.repeat, data_dir=args.data_dir)
+    report_df = compare_to_baseline(results, load_baselines(args.baseline), tolerance=args.tolerance)
+    print(report_df.to_string(index=False))
+
+    if args.save_baseline:
+        save_baselines(results, args.baseline)
+        print(f'Saved baselines to {args.baseline}')
+    elif (report_df['Regression'] == 'YES').any():
+        print(f"{(report_df['Regression'] == 'YES').sum()} stage(s) slower than baseline")
+        sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
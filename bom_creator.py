@@ -5,7 +5,10 @@ This module will load a BOM file from PDM (CSV or JSON) and create an Excel BOM
 """
 
 import argparse
+import os
 import bomloader
+import bomcache
+import bomdiff
 import dfexporter
 import misysloader
 import easygui
@@ -13,46 +16,109 @@ import pandas as pd
 import numpy as np
 from datetime import datetime as dt
 import odooloader
+import whereused
+import instrument
+import warnings
 
 
 class BOMCreator:
 
-    def __init__(self, export_file_name=None, csv_file_path=None):
+    @instrument.timed('BOMCreator.init')
+    def __init__(self, export_file_name=None, csv_file_path=None, use_cache=True, odoo_po_df=None, export_dir=None,
+                 previous_csv_file_path=None, low_memory=False, conditional_highlight=False,
+                 output_format='xlsx', streaming=False):
         """ Initialize a BOMCreator object
 
 
         Args:
             export_file_name (str, optional): File name or full path for exported Excel file.
                 If none given, the filename for the CSV will be used with a date stamp.
-            csv_file_path (str, optional): File path for BOM CSV file to load.
+            csv_file_path (str, optional): File path for BOM CSV (or JSON) file to load.
                 Required if using class directly without Drag-n-Drop batch file
+            use_cache (bool, optional): Reuse the processed BOM from cache if the CSV hasn't changed since it was
+                last processed. Can also be turned off with --no-cache.
+            odoo_po_df (DataFrame, optional): Odoo PO line data already loaded with OdooLoader.get_po_lines_df().
+                If none given, it is fetched from Odoo.
+            export_dir (str, optional): Directory for the exported Excel file if no export_file_name is given
+            previous_csv_file_path (str, optional): File path for a previous BOM CSV export of the same assembly.
+                add_changes_sheet will list the differences from it. Can also be given with --previous.
+            low_memory (bool, optional): Write the Excel file in constant memory mode, see DFExport. Can also be
+                turned on with --low-memory.
+            conditional_highlight (bool, optional): Highlight the BOM depths with conditional formats instead of
+                per cell formats, see DFExport. Can also be turned on with --conditional-highlight.
+            output_format (str, optional): xlsx for the formatted Excel BOM, or parquet, feather or csv to write each
+                sheet as a plain data file into a directory instead (named like the Excel file, without .xlsx). See
+                DFExport. Can also be given with --output-format.
+            streaming (bool, optional): Read the BOM CSVs in chunks, keeping only the BOM columns, so peak memory
+                grows with the BOM instead of the file size. See BOM.load_csv. Can also be turned on with --streaming.
         """
 
         # If using Drag and Drop - get CSV file name from arguments
         parser = argparse.ArgumentParser(description='Process CSV file')
         parser.add_argument('--file', default='')
+        parser.add_argument('--no-cache', action='store_true')
+        parser.add_argument('--previous', default='')
+        parser.add_argument('--low-memory', action='store_true')
+        parser.add_argument('--conditional-highlight', action='store_true')
+        parser.add_argument('--output-format', default='', choices=[''] + dfexporter.OUTPUT_FORMATS)
+        parser.add_argument('--streaming', action='store_true')
         args, unknown = parser.parse_known_args()
         file_name = args.file
-
-        # Check if file passed was .csv, if not set file path to None
-        if '.csv' in file_name.lower():
+        if args.no_cache:
+            use_cache = False
+        if args.low_memory:
+            low_memory = True
+        if args.conditional_highlight:
+            conditional_highlight = True
+        if args.output_format:
+            output_format = args.output_format
+        if args.streaming:
+            streaming = True
+        if '.csv' in args.previous.lower() or args.previous.lower().endswith('.json'):
+            previous_csv_file_path = args.previous
+
+        # Check if file passed was .csv (or .json), if not set file path to None
+        if '.csv' in file_name.lower() or file_name.lower().endswith('.json'):
             csv_file_path = file_name
 
         # Load BOM from CSV into DataFrame
-        self.full_bom_df = bomloader.BOM().load_csv(csv_file_path)
+        self.bom_cache = bomcache.BOMCache() if use_cache else None
+
+        self.streaming = streaming
+        self.full_bom_df = bomloader.BOM().load_csv(csv_file_path, streaming=self.streaming, cache=self.bom_cache)
+
+        # Load previous revision of the BOM (usually from cache) for the Changes sheet
+        self.previous_bom = None
+        if previous_csv_file_path:
+            self.previous_bom = bomloader.BOM().load_csv(previous_csv_file_path, streaming=self.streaming,
+                                                         cache=self.bom_cache)
 
-        # Load MIsys PO Data - OBSOLETE
-        # self.misys_po_df = misysloader.MisysTable(cache_age_limit=72).load_po_data()
+        # Add BOM to the where-used index of all processed assemblies
+        try:
+            whereused.WhereUsedIndex().update(self.full_bom_df)
+        except Exception as e:
+            warnings.warn(f'Could not update where-used index: {e}')
+
+        # Load MIsys PO Data (only for the BOM's parts) - OBSOLETE
+        # self.misys_po_df = misysloader.MisysTable(cache_age_limit=72) \
+        #     .load_po_data(part_numbers=self.full_bom_df.df['Part Number'].unique())
 
         # Load Odoo PO Data in DataFrame.
         # Filter only items that are purchased (no RFQ's or cancelled orders)
-        odoo_df = odooloader.OdooLoader().get_po_lines_df()
-        self.odoo_po_df = odoo_df.loc[odoo_df['Status'] == 'purchase']
+        if odoo_po_df is None:
+            odoo_po_df = odooloader.OdooLoader().get_po_lines_df()
+        self.odoo_po_df = odoo_po_df.loc[odoo_po_df['Status'] == 'purchase']
 
         # Create Excel DFExporter object
         if export_file_name is None:
-            export_file_name = f'{self.full_bom_df.get_date_from_file()} {self.full_bom_df.get_assy_from_file()}.xlsx'
-        self.excel_export = dfexporter.DFExport(export_file_name)
+            export_file_name = f'{self.full_bom_df.get_date_from_file()} {self.full_bom_df.get_assy_from_file()}'
+            if output_format == 'xlsx':
+                export_file_name += '.xlsx'
+            if export_dir:
+                export_file_name = os.path.join(export_dir, export_file_name)
+        self.excel_export = dfexporter.DFExport(export_file_name, constant_memory=low_memory,
+                                                conditional_highlight=conditional_highlight,
+                                                output_format=output_format)
 
         # Create a DF with BOM info grouped by Part Number
         self.part_bom_df = self.create_part_bom_df()
@@ -81,7 +147,18 @@ class BOMCreator:
                               'Unique ID',
                               'Parent ID',
                               'Parent List']
-
+        self.full_bom_col_widths = None
+
+    def get_full_bom_col_widths(self):
+        """ Return autofit widths of the full BOM columns. Worked out once and reused by every sheet listing all
+        the BOM lines. """
+        if self.full_bom_col_widths is None and self.excel_export.output_format == 'xlsx':
+            df = self.full_bom_df.df
+            self.full_bom_col_widths = self.excel_export.get_col_widths(
+                df[[col for col in self.full_bom_cols if col in df.columns]])
+        return self.full_bom_col_widths
+
+    @instrument.timed()
     def add_assy_bom_sheet(self):
 
         assy_bom_cols = ['Level',
@@ -93,6 +170,9 @@ class BOMCreator:
                          'Total QTY',
                          'Material',
                          'Weight',
+                         'Rollup Weight',
+                         'Unit Price',
+                         'Rollup Cost',
                          'Used On',
                          'Cage Code',
                          'Revision',
@@ -101,7 +181,7 @@ class BOMCreator:
                          'Drawing Number',
                          'Duplicate']
 
-        self.excel_export.add_sheet(self.full_bom_df.df,
+        self.excel_export.add_sheet(self.get_rollup_df(),
                                     sheet_name='Assembly BOM',
                                     freeze_col=5, freeze_row=1,
                                     cols_to_print=assy_bom_cols,
@@ -110,13 +190,39 @@ class BOMCreator:
                                     highlight_depth=True,
                                     highlight_col_limit=0,
                                     cols_to_indent=['Part Number'],
-                                    print_index=True)
+                                    print_index=True,
+                                    col_widths=self.get_full_bom_col_widths())
 
-    def add_drawing_list_sheet(self):
+    def get_unit_prices(self):
+        """ Return the unit price of the latest purchased PO line for each Product Number """
+        po_df = self.odoo_po_df.dropna(subset=['Product Number', 'Unit Price'])
+        return po_df.sort_values('Due Date').drop_duplicates('Product Number', keep='last') \
+            .set_index('Product Number')['Unit Price']
 
-        drawing_bom_df = self.full_bom_df.df[self.full_bom_df.df['Drawing Number'].notnull()] \
-            .drop_duplicates('Drawing Number') \
-            .sort_values('Drawing Number')
+    def get_rollup_df(self):
+        """ Create a copy of the full BOM DF with weight and cost rolled up from the parts to each subassembly
+
+        Rollup Weight and Rollup Cost are for one of each line, i.e. the sum of QTY x rollup of its children, or
+        its own Weight / Unit Price for lines without children. Unit Price comes from the PO data when present.
+
+        Returns:
+            DataFrame: Full BOM DF with Rollup Weight, Unit Price and Rollup Cost columns
+        """
+
+        df = self.full_bom_df.df.copy()
+        tree = self.full_bom_df.tree
+        qty = df['QTY'].fillna(0).to_numpy(dtype='float64')
+
+        weight = pd.to_numeric(df['Weight'], errors='coerce').fillna(0)
+        df['Rollup Weight'] = tree.rollup(weight, qty)
+
+        df['Unit Price'] = df['Part Number'].map(self.get_unit_prices()).astype('float64')
+        df['Rollup Cost'] = tree.rollup(df['Unit Price'].fillna(0), qty)
+
+        return df
+
+    @instrument.timed()
+    def add_drawing_list_sheet(self):
 
         drw_bom_cols = ['Drawing Number',
                         'Description',
@@ -124,6 +230,11 @@ class BOMCreator:
                         'Revision',
                         'Latest Version']
 
+        drawing_bom_df = self.full_bom_df.get_df(drw_bom_cols)
+        drawing_bom_df = drawing_bom_df[drawing_bom_df['Drawing Number'].notnull()] \
+            .drop_duplicates('Drawing Number') \
+            .sort_values('Drawing Number')
+
         self.excel_export.add_sheet(drawing_bom_df,
                                     sheet_name='Drawings',
                                     cols_to_print=drw_bom_cols,
@@ -131,16 +242,17 @@ class BOMCreator:
 
     def add_drawing_tree(self):
 
-        drawing_bom_df = self.full_bom_df.df[self.full_bom_df.df['Drawing Number'].notnull()] \
-            .drop_duplicates('Drawing Number') \
-            .sort_values('Drawing Number')
-
         drw_bom_cols = ['Drawing Number',
                         'Description',
                         'State',
                         'Revision',
                         'Latest Version']
 
+        drawing_bom_df = self.full_bom_df.get_df(drw_bom_cols)
+        drawing_bom_df = drawing_bom_df[drawing_bom_df['Drawing Number'].notnull()] \
+            .drop_duplicates('Drawing Number') \
+            .sort_values('Drawing Number')
+
         self.excel_export.add_sheet(drawing_bom_df,
                                     sheet_name='Drawings',
                                     cols_to_print=drw_bom_cols,
@@ -165,8 +277,11 @@ class BOMCreator:
                                                                         'Weight': 'first'
                                                                         }).reset_index()
 
-        return part_bom_df['Weight'].fillna(0, inplace=True)
+        part_bom_df['Weight'].fillna(0, inplace=True)
+
+        return part_bom_df
 
+    @instrument.timed()
     def add_mnp_sheet(self):
 
         self.mnp_df = self.part_bom_df
@@ -189,6 +304,7 @@ class BOMCreator:
                                     cols_to_print=mnp_cols,
                                     print_index=False)
 
+    @instrument.timed()
     def add_purchasing_status_sheet(self, shipset_qty=None):
 
         if shipset_qty is None:
@@ -235,6 +351,7 @@ class BOMCreator:
                                     cols_to_print=purch_cols,
                                     print_index=False)
 
+    @instrument.timed()
     def add_po_data_sheet(self):
 
         po_data_cols = ['PO Number',
@@ -265,6 +382,7 @@ class BOMCreator:
                                     cols_to_print=po_data_cols,
                                     print_index=False)
 
+    @instrument.timed()
     def add_odoo_po_data_sheet(self):
 
         odoo_po_cols = [
@@ -324,11 +442,8 @@ class BOMCreator:
 
         df = self.full_bom_df.df
 
-        # Look-up Unique ID for given Level
-        def lookup_parent_index(x):
-            return int(df.loc[df['Unique ID'] == x].iloc[0].name) if (x and x is not np.nan) else 0
-
-        df['Parent Index'] = df['Parent ID'].apply(lookup_parent_index).astype('Int64')
+        # Look-up row index of the parent line, 0 for top level lines
+        df['Parent Index'] = pd.Series(np.maximum(self.full_bom_df.tree.parent, 0), index=df.index).astype('Int64')
 
         # assy_groups = df.groupby(by='Parent Index')
         #
@@ -418,6 +533,7 @@ class BOMCreator:
 
         return grouped_df[schedule_bom_cols]
 
+    @instrument.timed()
     def add_schedule_bom_sheet(self):
 
         df = self.get_schedule_df()
@@ -432,8 +548,26 @@ class BOMCreator:
                                     print_index=True,
                                     col_formats={'Start': 'custom', 'Finish': 'custom', 'Cage Code': 'string',
                                                  'Level': 'string'},
-                                    col_style={'Start': date_format, 'Finish': date_format})
+                                    col_style={'Start': date_format, 'Finish': date_format},
+                                    col_widths=self.get_full_bom_col_widths())
+
+    @instrument.timed()
+    def add_changes_sheet(self):
+        """ Add sheet listing lines added, removed and changed since the previous BOM. Prompts for the previous
+        BOM CSV file if none was given. """
+
+        if self.previous_bom is None:
+            self.previous_bom = bomloader.BOM().load_csv(streaming=self.streaming, cache=self.bom_cache)
 
+        changes_df = bomdiff.BOMDiff(self.previous_bom, self.full_bom_df).changes_df
+
+        self.excel_export.add_sheet(changes_df,
+                                    sheet_name='Changes',
+                                    freeze_col=3, freeze_row=1,
+                                    print_index=False,
+                                    col_formats={'Level': 'string'})
+
+    @instrument.timed()
     def add_debug_sheet(self):
         self.excel_export.add_raw_sheet(self.full_bom_df.df, 'Debug')
 
@@ -442,6 +576,13 @@ class BOMCreator:
 
 
 def main():
+    # Optional timing and memory report of each stage, ex. --profile profile.json
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--profile', default='')
+    args, unknown = parser.parse_known_args()
+    if args.profile:
+        instrument.enable()
+
     bom_creator = BOMCreator()
     bom_creator.add_assy_bom_sheet()
     bom_creator.add_schedule_bom_sheet()
@@ -450,8 +591,13 @@ def main():
     bom_creator.add_purchasing_status_sheet()
     bom_creator.add_po_data_sheet()
     bom_creator.add_odoo_po_data_sheet()
+    if bom_creator.previous_bom is not None:
+        bom_creator.add_changes_sheet()
     bom_creator.write_book()
 
+    if args.profile:
+        instrument.write_report(args.profile)
+
 
 def main_test():
     global bom_creator
@@ -0,0 +1,97 @@
+""" Module used to cache fully processed BOM DataFrames on disk
+
+Cache entries are Parquet files named after a hash of the PDM CSV file contents and the BOM pipeline version, so
+re-running reports on an unchanged export can skip all of the BOM processing. The cache directory is kept under a
+size limit by evicting the least recently used entries.
+
+    Typical usage example:
+    cache = BOMCache()
+    key = cache.get_key('test/test.csv', pipeline_version=1)
+    df = cache.load(key)
+"""
+
+import pandas as pd
+import hashlib
+import os
+import instrument
+
+
+class BOMCache:
+    """ Content-addressed store of processed BOM DataFrames
+
+        Attributes:
+            cache_dir: Directory that holds the cached Parquet files
+            size_limit: Max total size of the cache directory in MB. Oldest used entries are removed past this.
+    """
+
+    def __init__(self, cache_dir='cache/bom', size_limit=500):
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+
+    def get_key(self, file_path, pipeline_version, *options):
+        """ Return cache key for the contents of given file, BOM pipeline version and any other load options """
+        file_hash = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1024 * 1024), b''):
+                file_hash.update(block)
+
+        file_hash.update(f'{pipeline_version}{options}'.encode())
+        return file_hash.hexdigest()
+
+    @instrument.timed('BOMCache.load')
+    def load(self, key):
+        """ Return cached BOM DataFrame for given key, or None if not in cache """
+        cache_path = self.__cache_path(key)
+        if not os.path.exists(cache_path):
+            return None
+
+        # Touch the file so eviction knows it was recently used
+        os.utime(cache_path)
+
+        df = pd.read_parquet(cache_path)
+
+        # Undo the Parquet friendly conversions from save()
+        if 'Level' in df.columns:
+            df['Level'] = df['Level'].map(lambda x: int(x) if isinstance(x, str) and '.' not in x else x)
+
+        return df
+
+    @instrument.timed('BOMCache.save', rows_arg='df')
+    def save(self, key, df):
+        """ Save BOM DataFrame under given key, then evict old entries if the cache is over the size limit """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        # Top level items have an integer Level, sub-items a string. Parquet needs a single type per column.
+        df = df.copy()
+        if 'Level' in df.columns:
+            df['Level'] = df['Level'].map(lambda x: str(x) if pd.notnull(x) else None)
+
+        # Write to temp file and then move, so a crash never leaves a half written cache entry
+        cache_path = self.__cache_path(key)
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+        df.to_parquet(temp_path)
+        os.replace(temp_path, cache_path)
+
+        self.evict()
+
+    def evict(self):
+        """ Remove least recently used entries until the cache is under the size limit """
+        entries = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.parquet')]
+        entries.sort(key=os.path.getmtime)
+
+        total_size = sum(os.path.getsize(f) for f in entries)
+        while entries and total_size > self.size_limit * 1024 * 1024:
+            oldest = entries.pop(0)
+            total_size -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def clear(self):
+        """ Remove all cached BOMs """
+        if os.path.exists(self.cache_dir):
+            for f in os.listdir(self.cache_dir):
+                if f.endswith('.parquet'):
+                    os.remove(os.path.join(self.cache_dir, f))
+
+    def __cache_path(self, key):
+        return os.path.join(self.cache_dir, f'{key}.parquet')
@@ -0,0 +1,191 @@
+""" Module used to compare two processed BOMs, ex. a new PDM export against the previously processed revision
+
+Each line gets three 64 bit hashes, all computed with vectorized passes over the BOMTree:
+    - key hash: the line's Part Number, used to match lines between the two BOMs
+    - line hash: the line's own data (Part Number, QTY, Description, etc.)
+    - subtree hash: the line hash combined with the subtree hashes of its children
+
+Matching starts at the top and only goes down into the children of matched lines whose subtree hash changed, so
+finding the changes costs time in proportion to the size of the change. Siblings with the same Part Number are paired
+identical subtree first, then identical line, then in the order they occur.
+
+    Typical usage example:
+    diff = BOMDiff(old_bom, new_bom)
+    changes_df = diff.changes_df
+"""
+
+import collections
+
+import pandas as pd
+import numpy as np
+
+# Line data compared between the two BOMs
+DIFF_COLUMNS = ['Part Number',
+                'QTY',
+                'Description',
+                'Revision',
+                'Cage Code',
+                'Material',
+                'Finish 1',
+                'Finish 2',
+                'Finish 3',
+                'Weight',
+                'State',
+                'Latest Version']
+
+HASH_MULTIPLIER = np.uint64(0x9E3779B97F4A7C15)
+
+
+def mix_hashes(*hashes):
+    """ Combine uint64 hash arrays element-wise into one uint64 hash array """
+    mixed = np.zeros(len(hashes[0]), dtype=np.uint64)
+    for h in hashes:
+        mixed = (mixed ^ np.asarray(h, dtype=np.uint64)) * HASH_MULTIPLIER
+        mixed ^= mixed >> np.uint64(29)
+    return mixed
+
+
+def hash_columns(df, columns):
+    """ Hash the values of given columns for each row. Values are compared as strings so dtypes don't matter. """
+    columns = [col for col in columns if col in df.columns]
+    return pd.util.hash_pandas_object(df[columns].astype(str), index=False).to_numpy()
+
+
+def subtree_hashes(tree, line_hashes):
+    """ Combine line hash of each line with the subtree hashes of its children, from the deepest level up """
+    subtree = np.zeros(len(tree), dtype=np.uint64)
+    child_sum = np.zeros(len(tree), dtype=np.uint64)
+    for rows in reversed(tree.depth_levels()):
+        subtree[rows] = mix_hashes(line_hashes[rows], child_sum[rows])
+
+        child_rows = rows[tree.parent[rows] >= 0]
+        np.add.at(child_sum, tree.parent[child_rows], mix_hashes(subtree[child_rows]))
+    return subtree
+
+
+class BOMDiff:
+    """ Finds added, removed and changed lines between an old and a new processed BOM
+
+        Attributes:
+            old_bom: Old BOM object
+            new_bom: New BOM object
+            changes_df: DataFrame with one line per change, in new BOM order
+            affected_rows: Row positions in the new BOM that are added or changed, or have an added, removed or
+                changed line under them
+    """
+
+    def __init__(self, old_bom, new_bom):
+        self.old_bom = old_bom
+        self.new_bom = new_bom
+
+        old_df, new_df = old_bom.df, new_bom.df
+        old_tree, new_tree = old_bom.tree, new_bom.tree
+
+        self.__old_line = hash_columns(old_df, DIFF_COLUMNS)
+        self.__new_line = hash_columns(new_df, DIFF_COLUMNS)
+        self.__old_subtree = subtree_hashes(old_tree, self.__old_line)
+        self.__new_subtree = subtree_hashes(new_tree, self.__new_line)
+
+        self.__old_key = hash_columns(old_df, ['Part Number'])
+        self.__new_key = hash_columns(new_df, ['Part Number'])
+
+        self.affected_rows = []
+        self.changes_df = self.__find_changes()
+
+    def __find_changes(self):
+        old_tree, new_tree = self.old_bom.tree, self.new_bom.tree
+        changes = []
+
+        # Top level items are compared first, then only the children of lines with a changed subtree
+        new_top = np.flatnonzero(new_tree.parent < 0)
+        old_top = np.flatnonzero(old_tree.parent < 0)
+        stack = [(new_top, old_top, None)]
+
+        while stack:
+            new_rows, old_rows, new_parent = stack.pop()
+            match = self.__match_siblings(new_rows, old_rows)
+
+            for new_pos in new_rows:
+                if new_pos not in match:
+                    changes.append(self.__change_row('Added', new_pos=new_pos))
+                    self.affected_rows.extend(new_tree.subtree(new_pos))
+                    continue
+
+                old_pos = match[new_pos]
+                if self.__new_subtree[new_pos] == self.__old_subtree[old_pos]:
+                    continue
+
+                self.affected_rows.append(new_pos)
+                if self.__new_line[new_pos] != self.__old_line[old_pos]:
+                    changes.append(self.__change_row('Changed', new_pos=new_pos, old_pos=old_pos))
+
+                stack.append((new_tree.children(new_pos), old_tree.children(old_pos), new_pos))
+
+            matched_old = set(match.values())
+            for old_pos in old_rows:
+                if old_pos not in matched_old:
+                    changes.append(self.__change_row('Removed', old_pos=old_pos, new_parent=new_parent))
+
+        self.affected_rows = np.unique(np.asarray(self.affected_rows, dtype=np.int64))
+
+        changes_df = pd.DataFrame(changes, columns=['Change', 'Level', 'Part Number', 'Description', 'Used On',
+                                                    'Old QTY', 'New QTY', 'Old Total QTY', 'New Total QTY',
+                                                    'Lines', 'Details', 'Sort'])
+        return changes_df.sort_values('Sort', kind='stable').drop(columns='Sort').reset_index(drop=True)
+
+    def __match_siblings(self, new_rows, old_rows):
+        """ Pair new and old sibling lines with the same Part Number. Each pass pairs the lines left over from the one
+        before: identical subtrees, then identical lines, then the rest in the order they occur.
+
+        Returns:
+            dict: Row position of the matching old line for each matched new line
+        """
+        match = {}
+        old_left = list(old_rows)
+        for new_hash, old_hash in ((self.__new_subtree, self.__old_subtree), (self.__new_line, self.__old_line),
+                                   (self.__new_key, self.__old_key)):
+            old_by_hash = collections.defaultdict(collections.deque)
+            for old_pos in old_left:
+                old_by_hash[(self.__old_key[old_pos], old_hash[old_pos])].append(old_pos)
+
+            for new_pos in new_rows:
+                candidates = old_by_hash.get((self.__new_key[new_pos], new_hash[new_pos]))
+                if new_pos not in match and candidates:
+                    match[new_pos] = candidates.popleft()
+
+            matched_old = set(match.values())
+            old_left = [old_pos for old_pos in old_left if old_pos not in matched_old]
+        return match
+
+    def __change_row(self, change, new_pos=None, old_pos=None, new_parent=None):
+        """ Create a changes_df row for given new and/or old line. Removed lines are placed after new_parent. """
+        new_line = self.new_bom.df.iloc[new_pos] if new_pos is not None else None
+        old_line = self.old_bom.df.iloc[old_pos] if old_pos is not None else None
+        line = new_line if new_line is not None else old_line
+
+        details = ''
+        if change == 'Changed':
+            details = '; '.join(f'{col}: {old_line[col]} -> {new_line[col]}' for col in DIFF_COLUMNS
+                                if col in line.index and str(old_line[col]) != str(new_line[col]))
+        elif change == 'Removed':
+            details = f'Was line {old_line["Level"]}'
+
+        if new_pos is not None:
+            lines = self.new_bom.tree.subtree_size(new_pos)
+            sort = self.new_bom.tree.enter[new_pos]
+        else:
+            lines = self.old_bom.tree.subtree_size(old_pos)
+            sort = self.new_bom.tree.enter[new_parent] + 0.5 if new_parent is not None else -1
+
+        return {'Change': change,
+                'Level': line['Level'],
+                'Part Number': line['Part Number'],
+                'Description': line.get('Description'),
+                'Used On': line.get('Used On'),
+                'Old QTY': old_line['QTY'] if old_line is not None else None,
+                'New QTY': new_line['QTY'] if new_line is not None else None,
+                'Old Total QTY': old_line['Total QTY'] if old_line is not None else None,
+                'New Total QTY': new_line['Total QTY'] if new_line is not None else None,
+                'Lines': lines,
+                'Details': details,
+                'Sort': sort}
@@ -0,0 +1,183 @@
+""" Module used to generate synthetic PDM BOM CSV files, for benchmarking and testing the BOM processing
+
+The generated files use the same layout as the PDM export (UTF-16 CSV, one line per part, SolidWorks drawings
+mixed in) so they go through exactly the same processing as a real BOM. Assemblies are grown one depth level at a
+time, so the BOM fills out evenly up to the given depth instead of being one long branch.
+
+    Typical usage example:
+    python bomgen.py bench.csv --rows 10000 --width 6 --depth 6 --duplicates 0.3 --dss 0.7
+"""
+
+import argparse
+import random
+
+import pandas as pd
+import bomloader
+
+CONFIGURATIONS = ['-1', '-2', '-3', '-101', 'Default', 'NOCONFIG', '-1_FLAT', '-2-DEPLOYED']
+MATERIALS = ['AL 6061-T6', 'AL 7075-T73', 'TI-6AL-4V', 'SS 304', 'SS A286', 'PEEK', 'VESPEL SP-1']
+FINISHES = ['ANODIZE TYPE II', 'ANODIZE TYPE III', 'CHEM FILM', 'PASSIVATE', 'ALODINE 1200']
+STATES = ['Released', 'Released', 'Released', 'In Work', 'Under Change']
+COTS_VENDORS = ['MS', 'NAS', 'MCMASTER', 'DIGIKEY', 'GLENAIR']
+
+# Share of part lines that have a drawing line (SLDDRW) right after them, like in PDM exports
+DRAWING_RATIO = 0.2
+
+
+class BOMGenerator:
+    """ Generates random PDM BOMs with a given shape
+
+        Attributes:
+            width: Average number of lines directly under an assembly
+            depth: Maximum number of levels under the top item
+            duplicate_ratio: Share of lines that reuse a part or subassembly already in the BOM. A reused
+                subassembly has the same lines under it everywhere it is used.
+            dss_ratio: Share of parts and assemblies that are DSS items, the rest are COTS
+            assembly_ratio: Share of lines above the bottom level that are subassemblies
+    """
+
+    def __init__(self, width=5, depth=5, duplicate_ratio=0.3, dss_ratio=0.7, assembly_ratio=0.3, seed=0):
+        self.width = width
+        self.depth = depth
+        self.duplicate_ratio = duplicate_ratio
+        self.dss_ratio = dss_ratio
+        self.assembly_ratio = assembly_ratio
+
+        self.__random = random.Random(seed)
+        self.__item_count = 0
+
+    def generate_df(self, rows=1000):
+        """ Generate a BOM with about given number of part lines
+
+        Args:
+            rows (int, optional): Number of part and assembly lines, not counting the drawing lines
+
+        Returns:
+            DataFrame: BOM in PDM CSV export layout
+        """
+        rnd = self.__random
+        parts = []
+        assemblies = {depth: [] for depth in range(self.depth + 1)}
+
+        # Nodes are [line, children]. Reused subassemblies share the same children list.
+        top = [self.__new_line('SLDASM'), []]
+        top[0]['QTY'] = 1
+        node_count = 1
+
+        # Add branches under the top item until there are enough lines. Each branch is grown one depth level at a
+        # time, with about width lines under each assembly.
+        while node_count < rows:
+            branch = [self.__new_line('SLDASM'), []]
+            top[1].append(branch)
+            assemblies[1].append(branch)
+            node_count += 1
+
+            level_nodes = [branch]
+            for depth in range(2, self.depth + 1):
+                next_level_nodes = []
+
+                for parent in level_nodes:
+                    for _ in range(rnd.randint(1, 2 * self.width - 1)):
+                        if node_count >= rows:
+                            break
+
+                        is_assembly = depth < self.depth and rnd.random() < self.assembly_ratio
+
+                        # Only reuse subassemblies from the same depth, so the BOM never gets deeper than depth
+                        reuse_from = assemblies[depth] if is_assembly else parts
+
+                        if reuse_from and rnd.random() < self.duplicate_ratio:
+                            line, children = rnd.choice(reuse_from)
+                            node = [{**line, 'QTY': rnd.randint(1, 4)}, children]
+                        else:
+                            node = [self.__new_line('SLDASM' if is_assembly else 'SLDPRT'), []]
+                            reuse_from.append(node)
+                            if is_assembly:
+                                next_level_nodes.append(node)
+
+                        parent[1].append(node)
+                        node_count += 1
+
+                level_nodes = next_level_nodes
+
+        return pd.DataFrame(self.__flatten(top, rows), columns=bomloader.BOM_CSV_COLUMNS)
+
+    def write_csv(self, file_path, rows=1000):
+        """ Generate a BOM and write it to file_path in the PDM CSV format. Returns the generated DataFrame. """
+        df = self.generate_df(rows)
+        df.to_csv(file_path, index=False, encoding='utf_16')
+        return df
+
+    def __flatten(self, top, rows):
+        """ List the lines in PDM export order with their Level, stopping after given number of part lines """
+        lines = []
+        part_count = 0
+
+        stack = [(top, '1')]
+        while stack and part_count < rows:
+            (line, children), level = stack.pop()
+            lines.append({**line, 'Level': level})
+            part_count += 1
+
+            # Drawings are listed in the export, but dropped by the BOM processing
+            if self.__random.random() < DRAWING_RATIO:
+                drawing_name = f"{line['Name'].rsplit('.', 1)[0]}.SLDDRW"
+                lines.append({**line, 'Level': f'{level}.0', 'Name': drawing_name})
+
+            stack.extend((child, f'{level}.{num}') for num, child in reversed(list(enumerate(children, 1))))
+
+        return lines
+
+    def __new_line(self, extension):
+        rnd = self.__random
+        self.__item_count += 1
+
+        is_dss = rnd.random() < self.dss_ratio
+        if is_dss:
+            # DSS part number, ex. 123F4567
+            prefix = f'{rnd.randint(1, 2)}{rnd.randint(0, 99):02d}{rnd.choice("FQNGEXT")}'
+            name = f'{prefix}{self.__item_count % 10000:04d}'
+            config = rnd.choice(CONFIGURATIONS)
+            part_num_override = None
+        else:
+            name = f'{rnd.choice(COTS_VENDORS)}{self.__item_count:06d}'
+            config = 'Default'
+            part_num_override = f'{name}-{rnd.randint(1, 20)}' if rnd.random() < 0.5 else None
+
+        is_part = extension == 'SLDPRT'
+        return {'Name': f'{name}.{extension}',
+                'Configuration': config,
+                'PartNumOverride': part_num_override,
+                'QTY': rnd.randint(1, 8) if is_part else rnd.randint(1, 2),
+                'Description': f'{"PART" if is_part else "ASSEMBLY"} {self.__item_count}',
+                'Cage Code': '1ABC2' if is_dss else rnd.choice(['', '81349', '96906']),
+                'Revision': rnd.choice('ABCD'),
+                'Material': rnd.choice(MATERIALS) if is_part and is_dss else None,
+                'Finish 1': rnd.choice(FINISHES) if is_part and is_dss and rnd.random() < 0.6 else None,
+                'Finish 2': rnd.choice(FINISHES) if is_part and is_dss and rnd.random() < 0.1 else None,
+                'Finish 3': None,
+                'Weight': round(rnd.uniform(0.001, 2.0), 4) if is_part else None,
+                'State': rnd.choice(STATES),
+                'ID': self.__item_count,
+                'Latest Version': rnd.randint(1, 12)}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate a synthetic PDM BOM CSV file')
+    parser.add_argument('file_path')
+    parser.add_argument('--rows', type=int, default=1000)
+    parser.add_argument('--width', type=int, default=5, help='Average number of lines under an assembly')
+    parser.add_argument('--depth', type=int, default=5, help='Maximum number of levels under the top item')
+    parser.add_argument('--duplicates', type=float, default=0.3, help='Share of lines reusing an earlier item')
+    parser.add_argument('--dss', type=float, default=0.7, help='Share of DSS items, the rest are COTS')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    generator = BOMGenerator(width=args.width, depth=args.depth, duplicate_ratio=args.duplicates,
+                             dss_ratio=args.dss, seed=args.seed)
+    df = generator.write_csv(args.file_path, rows=args.rows)
+    print(f'Wrote {len(df)} lines to {args.file_path}')
+
+
+if __name__ == '__main__':
+    main()
@@ -9,35 +9,289 @@ import numpy as np
 import easygui
 import os
 import datetime
-import math
 import warnings
+import json
+import re
+import bomtree
+import instrument
+from collections import namedtuple
 
 warnings.filterwarnings("ignore", 'This pattern has match groups')
 
+# Columns from the PDM CSV export that are used by the BOM processing and reports. Anything else is dropped
+# when streaming.
+BOM_CSV_COLUMNS = ['Level',
+                   'Name',
+                   'Configuration',
+                   'PartNumOverride',
+                   'QTY',
+                   'Description',
+                   'Cage Code',
+                   'Revision',
+                   'Material',
+                   'Finish 1',
+                   'Finish 2',
+                   'Finish 3',
+                   'Weight',
+                   'State',
+                   'ID',
+                   'Latest Version']
+
+# Columns that must stay as text when streaming (a chunk of only "-1" configurations would otherwise be read as int)
+BOM_CSV_TEXT_COLUMNS = ['Level',
+                        'Name',
+                        'Configuration',
+                        'PartNumOverride',
+                        'Description',
+                        'Cage Code',
+                        'Revision',
+                        'Material',
+                        'Finish 1',
+                        'Finish 2',
+                        'Finish 3',
+                        'State']
+
+CSV_CHUNK_SIZE = 50000
+
+# Bump whenever the processing in BOM.load_csv changes, so cached BOMs from older code aren't used
+PIPELINE_VERSION = 3
+
+# Low cardinality text columns, stored as categoricals with a single copy of each distinct value
+CATEGORY_COLUMNS = ['Type',
+                    'Extension',
+                    'Material',
+                    'Finish 1',
+                    'Finish 2',
+                    'Finish 3',
+                    'State',
+                    'Cage Code',
+                    'Configuration',
+                    'Used On',
+                    'Drawing',
+                    'Duplicate']
+
+
+JSON_BLOCK_SIZE = 1024 * 1024
+
+
+def iter_json_records(file_path, encoding='utf_8_sig', block_size=JSON_BLOCK_SIZE):
+    """ Yield the line objects of a PDM JSON BOM one at a time, without loading the whole document.
+
+    The JSON BOM is expected to be an array of line objects using the same keys as the CSV columns, ex.
+    [{"Level": "1.1", "Name": "123F4567.SLDPRT", "Configuration": "-1", "QTY": 2, ...}, ...]
+
+    Args:
+        file_path (str): File path for JSON file to read
+        encoding (str, optional): Text encoding of the file
+        block_size (int, optional): Number of characters read from the file at a time
+    """
+    decoder = json.JSONDecoder()
+
+    with open(file_path, encoding=encoding) as f:
+        buffer = f.read(block_size).lstrip()
+        if not buffer.startswith('['):
+            raise RuntimeError('JSON BOM must be an array of lines...')
+        pos = 1
+
+        while True:
+            # Skip whitespace and commas between lines, reading more of the file when the buffer runs out
+            while pos < len(buffer) and buffer[pos] in ' \t\r\n,':
+                pos += 1
+            if pos == len(buffer):
+                more = f.read(block_size)
+                if not more:
+                    raise RuntimeError('JSON BOM ended before the closing ]')
+                buffer, pos = more, 0
+                continue
+
+            if buffer[pos] == ']':
+                return
+
+            try:
+                record, pos = decoder.raw_decode(buffer, pos)
+            except json.JSONDecodeError:
+                # Line object is cut off at the end of the buffer - read more and try again
+                more = f.read(block_size)
+                if not more:
+                    raise
+                buffer, pos = buffer[pos:] + more, 0
+                continue
+
+            yield record
+
+
+# Columns derived after the BOM lines are sorted: column -> (load stage, columns it depends on). When loading with
+# lazy=True, a stage only runs the first time one of its columns is asked for.
+DERIVED_COLUMNS = {'Used On': ('used_on', ['Part Number', 'Parent ID']),
+                   'Parent List': ('used_on', ['Unique ID', 'Parent ID']),
+                   'Total QTY': ('total_qty', ['QTY', 'Parent ID']),
+                   'Drawing Number': ('drawings', ['Part Number']),
+                   'Drawing': ('drawings', ['Part Number']),
+                   'Duplicate': ('drawings', ['Part Number']),
+                   'Material': ('material', ['Material', 'Extension'])}
+
+
+# DSS part number, ex. 123F4567. Yes, the commas are also matched - kept for consistency with older BOMs.
+DSS_PN_REGEX = '[1,2][0-9]{2}[F,Q,N,G,E,X,T][0-9]{4}'
+
+DSS_PN_PATTERN = re.compile(DSS_PN_REGEX)
+DSS_STRIP_PATTERN = re.compile(f'^({DSS_PN_REGEX}[-][0-9]*).*')
+DSS_DRAWING_PATTERN = re.compile(f'^({DSS_PN_REGEX})')
+DSS_DASH_PATTERN = re.compile(f'^({DSS_PN_REGEX})[-]([0-9]*)')
+DSS_DASH1_PATTERN = re.compile(f'{DSS_PN_REGEX}(-1$|-1_)')
+
+PartNumberInfo = namedtuple('PartNumberInfo', ['part_number', 'dss', 'drawing_number', 'dash_number', 'dash_1'])
+
+
+def classify_part_number(part_number):
+    """ Parse a part number string in one go. BOMs repeat the same PNs many times, so call it once per unique PN.
+
+    Args:
+        part_number (str): Part number from PDM (file name + config, or PN override)
+
+    Returns:
+        PartNumberInfo: Part number with anything after the DSS dash number stripped (ex. 123F4567-100-DEPLOYED
+            becomes 123F4567-100), if it contains a DSS PN, the DSS drawing number it starts with, its dash number
+            and if it is a -1 item. Drawing and dash number are NaN for non-DSS items.
+    """
+
+    # https://stackoverflow.com/a/41609175/6475884 <- how the regex replace works
+    part_number = DSS_STRIP_PATTERN.sub(r'\1', part_number)
+
+    dash_match = DSS_DASH_PATTERN.match(part_number)
+    drawing_match = DSS_DRAWING_PATTERN.match(part_number)
+
+    return PartNumberInfo(part_number=part_number,
+                          dss=DSS_PN_PATTERN.search(part_number) is not None,
+                          drawing_number=drawing_match.group(1) if drawing_match else np.nan,
+                          dash_number=dash_match.group(2) if dash_match else np.nan,
+                          dash_1=DSS_DASH1_PATTERN.search(part_number) is not None)
+
+
+def memory_report(before_df, after_df):
+    """ Compare the memory used by each column of two versions of the same DataFrame
+
+    Args:
+        before_df (DataFrame): DataFrame before optimizing
+        after_df (DataFrame): DataFrame after optimizing
+
+    Returns:
+        DataFrame: Column, dtypes and MB before and after, with a Total row at the end
+    """
+    mb = 1024 * 1024
+    before = before_df.memory_usage(index=False, deep=True) / mb
+    after = after_df.memory_usage(index=False, deep=True) / mb
+
+    report_df = pd.DataFrame({'Column': before_df.columns,
+                              'Before Type': before_df.dtypes.astype(str).to_numpy(),
+                              'Before MB': before.to_numpy(),
+                              'After Type': after_df.dtypes.reindex(before_df.columns).astype(str).to_numpy(),
+                              'After MB': after.reindex(before_df.columns).to_numpy()})
+
+    total = {'Column': 'Total', 'Before Type': '', 'Before MB': before.sum(), 'After Type': '', 'After MB': after.sum()}
+    return pd.concat([report_df, pd.DataFrame([total])], ignore_index=True).round(3)
+
 
 class BOM:
     """ BOM class loads CSV BOM file and converts into a clean Pandas DataFrame
 
         Attributes:
             file_path: File path of CSV file
-            raw_df: DataFrame with unprocessed CSV data
+            raw_df: DataFrame with unprocessed CSV data. When loaded with streaming=True it is only read from the
+                CSV file the first time it is accessed.
+            tree: BOMTree of the lines in df, built on first access
     """
 
-    def __init__(self, file_path=None):
+    def __init__(self, file_path=None, streaming=False):
         """ Constructor for class, can optionally load CSV from given file path.
 
         Args:
             file_path (str, optional): File path for CSV file to load
+            streaming (bool, optional): Read the CSV in chunks, see load_csv
         """
+        self._df = None
+        self._raw_df = None
+        self._tree = None
+        self.__pending_stages = {}
+
         if file_path:
             self.file_path = file_path
-            self.load_csv(file_path)
+            self.load_csv(file_path, streaming=streaming)
+
+    @property
+    def df(self):
+        """ Processed BOM DataFrame. If loaded with lazy=True, derived columns that weren't computed yet are computed
+        on first access - use get_df to only compute the ones needed. """
+        if self.__pending_stages:
+            self.__compute_columns(DERIVED_COLUMNS)
+        return self._df
 
-    def load_csv(self, file_path=None):
-        """ Load CSV from given path, or if None given, prompt user using GUI.
+    @df.setter
+    def df(self, df):
+        self._df = df
+        self.__pending_stages = {}
+        self._tree = None
+
+    def get_df(self, columns=None):
+        """ Return processed BOM DataFrame with given columns, only computing the derived columns asked for.
 
         Args:
-            file_path (str, optional): File path for CSV file to load
+            columns (list, optional): Columns to return. Defaults to all, same as df.
+
+        Returns:
+            DataFrame: Processed BOM DataFrame
+        """
+        if columns is None:
+            return self.df
+
+        self.__compute_columns(columns)
+        if self.__pending_stages:
+            return self.__cast_types(self._df[columns])
+        return self._df[columns]
+
+    @property
+    def raw_df(self):
+        """ DataFrame with unprocessed CSV data, read from file on first access if it wasn't kept at load time """
+        if self._raw_df is None:
+            if self.__is_json():
+                self._raw_df = pd.DataFrame(iter_json_records(self.file_path))
+            else:
+                self._raw_df = pd.read_csv(self.file_path, encoding='utf_16', dtype={'Level': object},
+                                           float_precision='round_trip', error_bad_lines=False)
+        return self._raw_df
+
+    @raw_df.setter
+    def raw_df(self, df):
+        self._raw_df = df
+
+    @property
+    def tree(self):
+        """ BOMTree with parent/children arrays and subtree intervals for the rows of df """
+        if self._tree is None:
+            self._tree = bomtree.BOMTree.from_bom_df(self._df)
+        return self._tree
+
+    def get_subassembly_df(self, unique_id):
+        """ Return rows of the line with given Unique ID and everything under it, in BOM order """
+        return self._df.iloc[self.tree.subtree(self.tree.position(unique_id))]
+
+    @instrument.timed('BOM.load_csv', rows=lambda bom: len(bom._df))
+    def load_csv(self, file_path=None, streaming=False, chunk_size=CSV_CHUNK_SIZE, cache=None, lazy=False):
+        """ Load CSV (or JSON) from given path, or if None given, prompt user using GUI.
+
+        Args:
+            file_path (str, optional): File path for CSV file to load. A .json file is read with
+                iter_json_records, always streamed in chunks like streaming=True.
+            streaming (bool, optional): Read the CSV in chunks of chunk_size lines, keeping only the columns in
+                BOM_CSV_COLUMNS and only SolidWorks part/assembly lines. Peak memory then grows with the kept data
+                instead of the file size. raw_df is not kept and will be re-read from file if accessed.
+            chunk_size (int, optional): Number of CSV lines per chunk when streaming
+            cache (BOMCache, optional): Cache of processed BOMs. If the file contents were already processed by
+                this version of the pipeline, the cached DataFrame is used and no processing is done. raw_df is
+                then re-read from file if accessed.
+            lazy (bool, optional): Only load, sort and classify the lines. The DERIVED_COLUMNS are each computed
+                the first time they are asked for through df or get_df. Lazy loaded BOMs aren't saved to cache.
+                For scripts that only need a few columns - BOMCreator loads fully, its sheets use nearly all of them.
 
         Returns:
             Self instance of class object
@@ -46,22 +300,50 @@ class BOM:
         # Prompt user for file path if none given
         if file_path is None:
             self.file_path = easygui.fileopenbox(msg='Choose PDM BOM CSV file', default='*.csv',
-                                                 filetypes=[["*.csv", "All files"]])
+                                                 filetypes=[["*.csv", "*.json", "All files"]])
         else:
             self.file_path = file_path
 
         # Read CSV file into DataFrame. Throw error if trying to read non-CSV
-        if '.csv' not in self.file_path:
+        if '.csv' not in self.file_path and not self.__is_json():
             raise RuntimeError("Trying to load a non-CSV file...")
 
-        self.df = pd.read_csv(self.file_path, encoding='utf_16', dtype={'Level': object},
-                              float_precision='round_trip', error_bad_lines=False)
+        self._tree = None
+        self.__pending_stages = {}
+
+        # Use the processed BOM from cache if this exact file was already processed
+        if cache is not None:
+            cache_key = cache.get_key(self.file_path, PIPELINE_VERSION, streaming)
+            try:
+                cached_df = cache.load(cache_key)
+            except Exception as e:
+                warnings.warn(f'Could not read BOM cache, processing CSV instead: {e}')
+                cached_df = None
+
+            if cached_df is not None:
+                self.raw_df = None
+                self._df = cached_df
+                return self
+
+        if self.__is_json():
+            # JSON exports are too big to read in one go, so they are always streamed
+            self.raw_df = None
+            self._df = self.__read_json_chunks(chunk_size)
+        elif streaming:
+            # Raw data isn't kept - it is lazily re-read from file if needed
+            self.raw_df = None
+            self._df = self.__read_csv_chunks(chunk_size)
+        else:
+            self.__read_csv_file()
 
-        # Create copy of DataFrame for raw data
-        self.raw_df = self.df.copy()
+            # Create copy of DataFrame for raw data
+            self.raw_df = self._df.copy()
 
         # Create a unique Unique ID for each line
-        self.df = self.df.reset_index().rename(columns={'index': 'Unique ID'})
+        self._df = self._df.reset_index().rename(columns={'index': 'Unique ID'})
+
+        if self._df.empty:
+            raise RuntimeError('BOM file has no lines...')
 
         # Check for level column:
         self.__check_cols(['Level'])
@@ -70,168 +352,353 @@ class BOM:
         self.__process_part_numbers()
         self.__determine_part_type()
         self.__sort_df()
-        self.__get_used_on()
-        self.__get_total_qty()
-        self.__more_stuff()
 
-        # Cast specific data types
+        # Derived columns, see DERIVED_COLUMNS. Data types are cast once all of them are done.
+        self.__pending_stages = {'used_on': self.__get_used_on,
+                                 'total_qty': self.__get_total_qty,
+                                 'drawings': self.__get_drawings,
+                                 'material': self.__fix_material}
+        if lazy:
+            return self
+
+        self.__compute_columns(DERIVED_COLUMNS)
+
+        if cache is not None:
+            try:
+                cache.save(cache_key, self._df)
+            except Exception as e:
+                warnings.warn(f'Could not save BOM to cache: {e}')
+
+        return self
+
+    def __compute_columns(self, columns):
+        """ Run the load stages for any derived columns in given list that aren't computed yet """
+        for col in columns:
+            if col not in DERIVED_COLUMNS:
+                continue
+
+            stage, depends_on = DERIVED_COLUMNS[col]
+            if stage in self.__pending_stages:
+                self.__compute_columns([dep for dep in depends_on if DERIVED_COLUMNS.get(dep, (None,))[0] != stage])
+                self.__pending_stages.pop(stage)()
+
+                if not self.__pending_stages:
+                    self._df = self.__cast_types(self._df)
+
+    @staticmethod
+    def __cast_types(df):
+        """ Cast specific data types, for the columns that are in given DF """
         Int64 = pd.Int64Dtype()
 
-        data_types = {'Depth': Int64,
+        data_types = {'Depth': pd.Int8Dtype(),
                       'ID': Int64,
                       'Latest Version': Int64,
-                      'QTY': Int64,
+                      'QTY': pd.Int32Dtype(),
                       'Unique ID': Int64,
                       'Parent ID': Int64,
                       'Total QTY': Int64}
 
-        self.df = self.df.astype(data_types)
+        # Only text columns become categoricals, so numeric columns (ex. an all number Cage Code) keep their type
+        data_types.update({col: 'category' for col in CATEGORY_COLUMNS
+                           if col in df.columns and df[col].dtype == object})
 
-        return self
+        return df.astype({col: dtype for col, dtype in data_types.items() if col in df.columns})
+
+    def get_memory_report(self):
+        """ Return DataFrame with the memory used by each column of the processed BOM, compared to the plain
+        representation it used to have (object strings, Int64 and a list of Unique IDs per line for Parent List).
+
+        Returns:
+            DataFrame: Column, dtypes and MB before and after, with a Total row at the end
+        """
+        df = self.df
+
+        plain_df = df.astype({col: object for col in df.columns if isinstance(df[col].dtype, pd.CategoricalDtype)})
+        plain_df = plain_df.astype({col: pd.Int64Dtype() for col in ['Depth', 'QTY'] if col in df.columns})
+
+        if 'Parent List' in df.columns:
+            parent_lists = [[]] + [[int(i) for i in ids.strip('[]').split(', ')]
+                                   for ids in df['Parent List'].cat.categories]
+            plain_df['Parent List'] = [list(parent_lists[code + 1]) for code in df['Parent List'].cat.codes]
+
+        return memory_report(plain_df, df)
 
+    @instrument.timed('BOM.read_csv_file')
     def __read_csv_file(self):
         """ Internal method to read CSV file and load into DF"""
         if '.csv' not in self.file_path:
             raise RuntimeError("Trying to load a non-CSV file...")
 
-        self.df = pd.read_csv(self.file_path, encoding='utf_16', dtype={'Level': object},
+        self._df = pd.read_csv(self.file_path, encoding='utf_16', dtype={'Level': object},
                               float_precision='round_trip', error_bad_lines=False)
 
+    @instrument.timed('BOM.read_csv_chunks')
+    def __read_csv_chunks(self, chunk_size):
+        """ Internal method to stream CSV file in chunks, keeping only used columns and SolidWorks files.
+
+        The original CSV line number is kept as the index so Unique ID matches a non-streamed load.
+        """
+        text_cols = {col: object for col in BOM_CSV_TEXT_COLUMNS}
+
+        reader = pd.read_csv(self.file_path, encoding='utf_16', dtype=text_cols,
+                             usecols=lambda col: col in BOM_CSV_COLUMNS, chunksize=chunk_size,
+                             float_precision='round_trip', error_bad_lines=False)
+
+        return self.__concat_chunks(reader)
+
+    @instrument.timed('BOM.read_json_chunks')
+    def __read_json_chunks(self, chunk_size):
+        """ Internal method to stream JSON file in chunks of lines, keeping only used columns and SolidWorks files.
+
+        The line number in the JSON array is used as the index, same as the CSV line number for CSV files.
+        """
+
+        def json_chunks():
+            records = []
+            start = 0
+            for record in iter_json_records(self.file_path):
+                records.append(record)
+                if len(records) == chunk_size:
+                    yield self.__json_records_to_df(records, start)
+                    start += len(records)
+                    records = []
+            if records:
+                yield self.__json_records_to_df(records, start)
+
+        return self.__concat_chunks(json_chunks())
+
+    @staticmethod
+    def __json_records_to_df(records, start):
+        """ Convert list of JSON line objects to a DataFrame with all of the BOM_CSV_COLUMNS. PDM leaves out keys
+        whose value is null, so any missing key is NaN, same as an empty CSV cell. """
+        df = pd.DataFrame.from_records(records, columns=BOM_CSV_COLUMNS,
+                                       index=pd.RangeIndex(start, start + len(records)))
+
+        # Match the CSV reader - JSON nulls as NaN and text columns as strings (ex. Level 1.1 could be a number)
+        df = df.where(df.notnull(), np.nan)
+        for col in BOM_CSV_TEXT_COLUMNS:
+            if col in df.columns:
+                df[col] = df[col].map(lambda x: x if pd.isnull(x) else str(x))
+
+        return df
+
+    @staticmethod
+    def __concat_chunks(chunks):
+        """ Drop non-SolidWorks lines from each chunk and concatenate what's left into one DataFrame """
+        kept_chunks = []
+        for chunk in chunks:
+            # Same extension check as __process_part_numbers, done early so dropped lines are never held
+            extension = chunk['Name'].str.strip().str.upper().str.rsplit('.', n=1).str[-1]
+            kept_chunks.append(chunk.loc[extension.isin(['SLDPRT', 'SLDASM'])])
+
+        if not kept_chunks:
+            return pd.DataFrame(columns=BOM_CSV_COLUMNS)
+
+        return pd.concat(kept_chunks)
+
+    def __is_json(self):
+        return self.file_path.lower().endswith('.json')
+
+    @instrument.timed('BOM.process_part_numbers')
     def __process_part_numbers(self):
         """ Determine part number from file name and config, or part number override"""
 
         self.__check_cols(['Name', 'Configuration', 'PartNumOverride'])
 
         # Fix filename - force uppercase and split off extension
-        self.df['File Name'], self.df['Extension'] = self.df['Name'].str.strip().str.upper().str. \
+        self._df['File Name'], self._df['Extension'] = self._df['Name'].str.strip().str.upper().str. \
             rsplit('.', n=1).str
         # Drop any non-SW file from the list (gets rid of PSELF.DFs, etc)
-        self.df = self.df[self.df['Extension'].isin(['SLDPRT', 'SLDASM'])].reset_index(drop=True)
+        self._df = self._df[self._df['Extension'].isin(['SLDPRT', 'SLDASM'])].reset_index(drop=True)
 
         # Remove data from Part Number Column (crap data from PDM...)
-        self.df['Part Number'] = np.NaN
+        self._df['Part Number'] = np.NaN
 
         # Check for NOCONFIG and assign File Name only to Part Number
-        self.df.loc[self.df['Configuration'].fillna('NOCONFIG').str.upper() == 'NOCONFIG',
-                    ['Part Number']] = self.df['File Name']
+        self._df.loc[self._df['Configuration'].fillna('NOCONFIG').str.upper() == 'NOCONFIG',
+                    ['Part Number']] = self._df['File Name']
 
         # Check for PN Override and use that if true
-        self.df.loc[self.df['PartNumOverride'].notnull(), ['Part Number']] = self.df['PartNumOverride']
+        self._df.loc[self._df['PartNumOverride'].notnull(), ['Part Number']] = self._df['PartNumOverride']
 
         # Everything else, set PN to FILENAME + CONFIG
-        self.df.loc[self.df['Part Number'].isnull(), ['Part Number']] = self.df['File Name'] + self.df['Configuration']
+        self._df.loc[self._df['Part Number'].isnull(), ['Part Number']] = self._df['File Name'] + self._df['Configuration']
 
-        # For DSS PNs, strip out anything after the dash number (ex. 100-DEPLOYED)
-        # https://stackoverflow.com/a/41609175/6475884 <- how the regex replace works
-        self.df['Part Number'].replace(to_replace=r"^([1,2][0-9]{2}[F,Q,N,G,E,X,T][0-9]{4}[-][0-9]*).*",
-                                       value=r"\1", regex=True, inplace=True)
+        # Parse each unique part number once. For DSS PNs, this strips out anything after the dash number
+        # (ex. 100-DEPLOYED), and works out the DSS flag, drawing number and -1 status used by the later stages.
+        raw_part_numbers = self._df['Part Number']
+        stripped_pns, self.__pn_info = self.__classify_part_numbers(raw_part_numbers)
+        self._df['Part Number'] = raw_part_numbers.map(lambda x: stripped_pns.get(x, x))
 
+    @staticmethod
+    def __classify_part_numbers(part_numbers):
+        """ Classify the unique string values of given Part Number series
+
+        Returns:
+            dict: Raw part number -> part number with anything after the DSS dash number stripped
+            DataFrame: PartNumberInfo columns for each stripped part number
+        """
+        unique_pns = [pn for pn in pd.unique(part_numbers) if isinstance(pn, str)]
+        pn_info = [classify_part_number(pn) for pn in unique_pns]
+
+        stripped_pns = {pn: info.part_number for pn, info in zip(unique_pns, pn_info)}
+        info_df = pd.DataFrame(pn_info, columns=PartNumberInfo._fields).drop_duplicates('part_number') \
+            .set_index('part_number')
+
+        return stripped_pns, info_df
+
+    def __get_pn_info(self, field):
+        """ Look up PartNumberInfo field for every row, NaN for rows without a string part number """
+        return self.__pn_info[field].reindex(self._df['Part Number']).reset_index(drop=True)
+
+    @instrument.timed('BOM.determine_part_type')
     def __determine_part_type(self):
-        """Determine type of item (DSS part/assy or COTS) using some regex magic"""
+        """Determine type of item (DSS part/assy or COTS) from the part number classification"""
 
-        dss_part_filter = self.df['Part Number'].str.contains('[1,2][0-9]{2}[F,Q,N,G,E,X,T][0-9]{4}', na=False)
-        self.df.loc[dss_part_filter & (self.df['Extension'] == 'SLDPRT'), 'Type'] = 'DSS PART'
-        self.df.loc[dss_part_filter & (self.df['Extension'] == 'SLDASM'), 'Type'] = 'DSS ASSY'
-        self.df.loc[~dss_part_filter, 'Type'] = 'COTS'
+        dss_part_filter = self.__get_pn_info('dss').fillna(False).astype(bool)
+        self._df.loc[dss_part_filter & (self._df['Extension'] == 'SLDPRT'), 'Type'] = 'DSS PART'
+        self._df.loc[dss_part_filter & (self._df['Extension'] == 'SLDASM'), 'Type'] = 'DSS ASSY'
+        self._df.loc[~dss_part_filter, 'Type'] = 'COTS'
 
-    def __more_stuff(self):
+    @instrument.timed('BOM.get_drawings')
+    def __get_drawings(self):
         # Determine drawing number from valid DSS items
-        dss_drw_filter = self.df['Part Number'].str.contains('^[1,2][0-9]{2}[F,Q,N,G,E,X,T][0-9]{4}', na=False)
-        self.df['Drawing Number'] = self.df['Part Number'].loc[dss_drw_filter].replace(
-            to_replace=r"^([1,2][0-9]{2}[F,Q,N,G,E,X,T][0-9]{4}).*", value=r"\1", regex=True)
+        self._df['Drawing Number'] = self.__get_pn_info('drawing_number')
 
         # Determine if drawing (i.e. DSS Part or Assembly is a -1 number and is not duplicate)
-        dash1_filter = self.df['Part Number'].str.contains('[1,2][0-9]{2}[F,Q,N,G,E,X,T][0-9]{4}(-1$|-1_)', na=False)
-        self.df.loc[dash1_filter & (~self.df.duplicated('Part Number', 'first')), 'Drawing'] = 'Yes'
+        dash1_filter = self.__get_pn_info('dash_1').fillna(False).astype(bool)
+        self._df.loc[dash1_filter & (~self._df.duplicated('Part Number', 'first')), 'Drawing'] = 'Yes'
 
         # Mark duplicate parts
-        self.df.loc[self.df.duplicated('Part Number', 'first'), 'Duplicate'] = 'Yes'
+        self._df.loc[self._df.duplicated('Part Number', 'first'), 'Duplicate'] = 'Yes'
 
+    @instrument.timed('BOM.fix_material')
+    def __fix_material(self):
         # Assign N/A for Material on Assemblies
-        self.df.loc[(self.df['Material'].isnull()) & (self.df['Extension'] == 'SLDASM'), 'Material'] = 'N/A - Assembly'
+        self._df.loc[(self._df['Material'].isnull()) & (self._df['Extension'] == 'SLDASM'), 'Material'] = 'N/A - Assembly'
 
+    @instrument.timed('BOM.sort_df')
     def __sort_df(self):
+        """ Sort each assembly's children by Part Number and re-number the Level column to match.
 
-        df = self.df
+        A Level -> Unique ID hash index is built once to find each parent, then the new levels and the final row
+        order are assigned in a single depth-first pass over the tree.
+        """
+
+        df = self._df
 
         # First, figure out depth (i.e. count how many dots are in level)
-        df['Depth'] = df.loc[df['Level'].notnull(), 'Level'].astype('str').str.count('[.]')
+        levels = df.loc[df['Level'].notnull(), 'Level'].astype('str')
+        df['Depth'] = levels.str.count('[.]')
 
         # Second, determine the parent item Level (i.e. drop off last number, ex. 1.3.2.1 becomes 1.3.2
-        parent_level = df.loc[df['Level'].notnull(), 'Level'].astype('str').str.split('.').apply(
-            lambda x: '.'.join(x[:-1]))
+        parent_level = levels.str.rpartition('.')[0]
+
+        # Look-up Unique ID for given Level using a hash index (first line wins if a Level is repeated)
+        level_df = df.loc[df['Level'].notnull()].drop_duplicates('Level')
+        level_index = dict(zip(level_df['Level'].astype('str'), level_df['Unique ID']))
+
+        df['Parent ID'] = parent_level.map(lambda x: level_index.get(x, np.nan) if x else None)
+
+        missing_parents = df.loc[(df['Depth'] > 0) & df['Parent ID'].isnull(), 'Level']
+        if missing_parents.size > 0:
+            raise RuntimeError(f'BOM has lines with no parent line: {missing_parents.tolist()}')
 
-        # Look-up Unique ID for given Level
-        def lookup_parent_id(x):
-            return int(df.loc[df['Level'] == x]['Unique ID'].iloc[0]) if (x and x is not np.nan) else None
+        # Third, sort values at top level (i.e. depth == 0), and the rest of the DF by the name column.
+        # Children keep that order when bucketed under their parent.
+        top_df = df.loc[df['Depth'] == 0].sort_values(by='Part Number')
+        child_df = df.loc[df['Depth'] > 0].sort_values(by='Part Number')
 
-        df['Parent ID'] = parent_level.apply(lookup_parent_id)
+        row_pos = pd.Series(np.arange(len(df)), index=df.index)
+        unique_ids = df['Unique ID'].to_numpy()
 
-        # Third, sort values at top level (i.e. depth == 0) and create initial DF
-        sorted_df = df.loc[df['Depth'] == 0].sort_values(by='Part Number').reset_index(drop=True)
-        sorted_df['New Level'] = sorted_df.index + 1
+        children = {}
+        for pos, parent_id in zip(row_pos[child_df.index], child_df['Parent ID']):
+            children.setdefault(int(parent_id), []).append(pos)
 
-        # Group the rest of the DF by the depth and then the parent values, sort the groups by the name column
-        for key, group_df in df.loc[df['Depth'] > 0].sort_values(by='Part Number').groupby(by=['Depth', 'Parent ID']):
-            # key = [Depth, Parent ID]
-            # group_df = DataFrame for that group
+        # Walk the tree depth-first, giving each line its new level and position in the sorted DF
+        order = []
+        new_levels = []
+        stack = [(pos, num + 1) for num, pos in enumerate(row_pos[top_df.index])][::-1]
+        while stack:
+            pos, new_level = stack.pop()
+            order.append(pos)
+            new_levels.append(new_level)
+            child_pos = children.get(int(unique_ids[pos]), [])
+            stack.extend((child, f'{new_level}.{num + 1}') for num, child in reversed(list(enumerate(child_pos))))
 
-            # Reset the index order of the group
-            sorted_group_df = group_df.reset_index(drop=True)
+        sorted_df = df.iloc[order].reset_index(drop=True)
+        sorted_df['New Level'] = pd.Series(new_levels, dtype='object' if len(child_df) else 'int64')
 
-            # Get the new parent level
-            parent_new_level = str(sorted_df.loc[sorted_df['Unique ID'] == key[1], 'New Level'].iloc[0])
+        # Keep the same (alphabetical) column layout the sorted groups were always assembled with
+        if len(child_df):
+            sorted_df = sorted_df[sorted(sorted_df.columns)]
 
-            # group_df['New Level'] = group_df.index.to_series().astype(int).apply(
-            #    lambda x: '.'.join([parent_new_level, str(x + 1)]))
-            sorted_group_df['New Level'] = sorted_group_df.index.to_series().apply(
-                lambda x: '.'.join([parent_new_level, str(int(x) + 1)]))
+        self._df = sorted_df.rename(columns={'New Level': 'Level', 'Level': 'Old Level'})
+        self._tree = None
 
-            # In the new DataFrame, get the index location of the Parent for this group, then split the DF into two
-            parent_index = sorted_df.loc[sorted_df['Unique ID'] == key[1]].index[0] + 1
-            start_slice = sorted_df.iloc[0:parent_index]
-            end_slice = sorted_df.iloc[parent_index:]
+    def __get_ancestor_positions(self):
+        """ Return an array of ancestor row positions, one row per BOM line and one column per generation.
 
-            # Insert the new sorted group in the correct location in the new DF (after the parent)
-            sorted_df = pd.concat([start_slice, sorted_group_df, end_slice], sort=True).reset_index(drop=True)
+        Column 0 holds the parent's row position, column 1 the grandparent's, etc. Missing ancestors are -1. The
+        array is filled one depth level at a time with NumPy gathers on the tree's parent position array.
+        """
+
+        parent_pos = self.tree.parent
+        max_depth = int(self._df['Depth'].max()) if len(self._df) else 0
 
-        self.df = sorted_df.rename(columns={'New Level': 'Level', 'Level': 'Old Level'})
+        ancestors = np.full((len(self._df), max(max_depth, 1)), -1, dtype=np.int64)
+        next_parent = parent_pos
+        for generation in range(max_depth):
+            ancestors[:, generation] = next_parent
+            next_parent = np.where(next_parent >= 0, parent_pos[next_parent], -1)
 
+        return ancestors
+
+    @instrument.timed('BOM.get_used_on')
     def __get_used_on(self):
 
-        def lookup_parent(x):
-            return self.df.loc[self.df['Unique ID'] == x]['Part Number'].iloc[0] if not math.isnan(x) else None
+        parents = self.tree.parent
+
+        part_numbers = self._df['Part Number'].to_numpy(dtype=object)
+        self._df['Used On'] = np.where(parents >= 0, part_numbers[parents], None)
 
-        self.df['Used On'] = self.df['Parent ID'].apply(lookup_parent)
+        # Parent List is the chain of Unique IDs up to the top item, nearest parent first, ex. "[12, 5, 1]". Siblings
+        # share the same chain, so it is only built once per parent and stored as a categorical.
+        tree = self.tree
+        unique_ids = self._df['Unique ID'].to_numpy(dtype=np.int64)
+        parent_rows = np.unique(tree.parent[tree.parent >= 0])
 
-        def get_parent_list(x):
-            parent_list = []
-            next_parent = x
-            while math.isnan(next_parent) is False:
-                parent_list.append(int(next_parent))
-                next_parent = self.df.loc[self.df['Unique ID'] == next_parent]['Parent ID'].iloc[0]
-            return parent_list
+        # Parents in depth order, so the chain of a parent's own parent is always done first
+        chains = {}
+        for row in parent_rows[np.argsort(tree.depth[parent_rows], kind='stable')]:
+            grandparent = tree.parent[row]
+            chains[row] = f'{unique_ids[row]}, {chains[grandparent]}' if grandparent >= 0 else f'{unique_ids[row]}'
 
-        self.df['Parent List'] = self.df['Parent ID'].apply(get_parent_list)
+        # Top level lines have no parents, left empty
+        codes = np.where(tree.parent >= 0, np.searchsorted(parent_rows, tree.parent), -1)
+        self._df['Parent List'] = pd.Categorical.from_codes(codes, [f'[{chains[row]}]' for row in parent_rows])
 
+    @instrument.timed('BOM.get_total_qty')
     def __get_total_qty(self):
 
-        top_level_qty = self.df['QTY'][0]  # Probably always 1?
+        top_level_qty = self._df['QTY'][0]  # Probably always 1?
 
-        def get_parent_qtys(parent_id_list):
-            total_qty = top_level_qty
-            for id in parent_id_list:
-                total_qty *= self.df.loc[self.df['Unique ID'] == id]['QTY'].iloc[0]
-            return total_qty
+        # Multiply QTY of every ancestor together, one generation at a time
+        ancestors = self.__get_ancestor_positions()
+        qty = self._df['QTY'].to_numpy()
 
-        parent_qtys = self.df['Parent List'].apply(get_parent_qtys)
+        parent_qtys = np.full(len(self._df), top_level_qty, dtype=np.result_type(qty, top_level_qty))
+        for generation in range(ancestors.shape[1]):
+            has_ancestor = ancestors[:, generation] >= 0
+            parent_qtys[has_ancestor] *= qty[ancestors[has_ancestor, generation]]
 
-        self.df['Total QTY'] = self.df['QTY'] * parent_qtys
+        self._df['Total QTY'] = qty * parent_qtys
 
     def __check_cols(self, required_cols=[]):
         """ Checks if list of required columns is in CSV header"""
 
-        missing_cols = np.setdiff1d(required_cols, self.df.columns)
+        missing_cols = np.setdiff1d(required_cols, self._df.columns)
         if missing_cols.size > 0:
             raise RuntimeError(f'CSV is missing the following columns: {missing_cols}')
 
@@ -0,0 +1,145 @@
+""" Module with a compact, array-backed tree of BOM lines
+
+    Typical usage example:
+    tree = BOMTree.from_bom_df(bom.df)
+    subassembly_df = bom.df.iloc[tree.subtree(tree.position(unique_id))]
+"""
+
+import pandas as pd
+import numpy as np
+
+
+class BOMTree:
+    """ Tree of BOM lines stored in NumPy arrays. Nodes are row positions in the BOM DataFrame.
+
+        Attributes:
+            parent: Row position of each line's parent, -1 for top level lines
+            depth: Depth of each line, 0 for top level lines
+            child_offsets: CSR offsets, children of node i are child_index[child_offsets[i]:child_offsets[i + 1]]
+            child_index: CSR array of child row positions, in row order
+            preorder: Row positions in depth-first (pre-order) order
+            enter: Position of each node in preorder
+            exit: End (exclusive) of each node's subtree in preorder, so its subtree is preorder[enter:exit]
+            unique_ids: Unique ID of each line
+    """
+
+    def __init__(self, parent, unique_ids=None):
+        """ Build tree from parent row positions.
+
+        Args:
+            parent (array-like): Row position of each line's parent, -1 for top level lines
+            unique_ids (array-like, optional): Unique ID of each line. Defaults to the row positions.
+        """
+        self.parent = np.asarray(parent, dtype=np.int64)
+        size = len(self.parent)
+
+        self.unique_ids = np.arange(size) if unique_ids is None else np.asarray(unique_ids, dtype=np.int64)
+        self.__id_index = pd.Index(self.unique_ids)
+
+        # Children in CSR form - stable sort on parent keeps the children in row order
+        has_parent = self.parent >= 0
+        child_rows = np.flatnonzero(has_parent)
+        self.child_index = child_rows[np.argsort(self.parent[child_rows], kind='stable')]
+        self.child_offsets = np.zeros(size + 1, dtype=np.int64)
+        np.cumsum(np.bincount(self.parent[child_rows], minlength=size), out=self.child_offsets[1:])
+
+        # Pre-order walk to get the enter/exit intervals and depths
+        self.preorder = np.empty(size, dtype=np.int64)
+        self.enter = np.empty(size, dtype=np.int64)
+        self.exit = np.empty(size, dtype=np.int64)
+        self.depth = np.zeros(size, dtype=np.int64)
+
+        count = 0
+        stack = [(int(node), False) for node in np.flatnonzero(~has_parent)[::-1]]
+        while stack:
+            node, done = stack.pop()
+            if done:
+                self.exit[node] = count
+                continue
+
+            self.preorder[count] = node
+            self.enter[node] = count
+            count += 1
+
+            children = self.children(node)
+            self.depth[children] = self.depth[node] + 1
+            stack.append((node, True))
+            stack.extend((int(child), False) for child in children[::-1])
+
+        if count != size:
+            raise RuntimeError('BOM tree has lines that are not connected to a top level line')
+
+    @classmethod
+    def from_bom_df(cls, df):
+        """ Build tree from a processed BOM DataFrame (needs 'Unique ID' and 'Parent ID' columns) """
+        unique_ids = df['Unique ID'].to_numpy(dtype=np.int64)
+        parent = pd.Index(unique_ids).get_indexer(df['Parent ID'].astype('float64'))
+        return cls(parent, unique_ids)
+
+    def __len__(self):
+        return len(self.parent)
+
+    def position(self, unique_id):
+        """ Return row position of line with given Unique ID """
+        return self.__id_index.get_loc(unique_id)
+
+    def children(self, node):
+        """ Return row positions of direct children of node """
+        return self.child_index[self.child_offsets[node]:self.child_offsets[node + 1]]
+
+    def subtree(self, node):
+        """ Return row positions of node and everything under it, in pre-order """
+        return self.preorder[self.enter[node]:self.exit[node]]
+
+    def subtree_size(self, node):
+        """ Return number of lines in subtree of node, including itself """
+        return self.exit[node] - self.enter[node]
+
+    def is_ancestor(self, ancestor, node):
+        """ Return True if ancestor is node or one of its parents """
+        return self.enter[ancestor] <= self.enter[node] < self.exit[ancestor]
+
+    def ancestors(self, node):
+        """ Return row positions of the parents of node, nearest parent first """
+        ancestors = np.empty(self.depth[node], dtype=np.int64)
+        for generation in range(len(ancestors)):
+            node = self.parent[node]
+            ancestors[generation] = node
+        return ancestors
+
+    def depth_levels(self):
+        """ Return list of row position arrays, one per depth level starting at the top level """
+        by_depth = np.argsort(self.depth, kind='stable')
+        depth_starts = np.searchsorted(self.depth[by_depth], np.arange(self.depth.max(initial=0) + 2))
+        return [by_depth[start:end] for start, end in zip(depth_starts[:-1], depth_starts[1:])]
+
+    def rollup(self, values, qty):
+        """ Roll values up from the leaves, one depth level at a time.
+
+        A line with children gets the sum of QTY x rolled up value of its children, a line without children keeps
+        its own value. Ex. with unit weights, gives the mass of one of each subassembly.
+
+        Args:
+            values (array-like): Value for one of each line, ex. unit weight or unit price
+            qty (array-like): QTY of each line in its parent
+
+        Returns:
+            ndarray: Rolled up value for one of each line
+        """
+        rollup = np.asarray(values, dtype=np.float64).copy()
+        extended = np.asarray(qty, dtype=np.float64)
+
+        has_children = np.diff(self.child_offsets) > 0
+        child_sum = np.zeros(len(self))
+
+        # Walk from the deepest level up
+        for rows in reversed(self.depth_levels()):
+
+            # Children of these rows are all done, so their sums are final
+            rows_with_children = rows[has_children[rows]]
+            rollup[rows_with_children] = child_sum[rows_with_children]
+
+            child_rows = rows[self.parent[rows] >= 0]
+            np.add.at(child_sum, self.parent[child_rows], extended[child_rows] * rollup[child_rows])
+
+        return rollup
@@ -1,18 +1,96 @@
 import pandas as pd
+import numpy as np
+import os
 from datetime import datetime as dt
 import xlsxwriter
+from xlsxwriter.utility import xl_col_to_name
+import instrument
+
+# Output formats of DFExport. Only xlsx is formatted for people, the others are one plain data file per sheet.
+OUTPUT_FORMATS = ['xlsx', 'parquet', 'feather', 'csv']
+
+# Value types Parquet and Feather can store in an object column as is, anything else is written as text
+ARROW_INFERRED_TYPES = ['string', 'empty', 'integer', 'floating', 'mixed-integer-float', 'boolean', 'decimal',
+                        'datetime', 'datetime64', 'date', 'bytes']
+
+# Integer column dtypes, written to Excel as numbers
+INT_DTYPES = ['int64', 'Int64', 'int32', 'Int32', 'int16', 'Int16', 'int8', 'Int8']
+
+# Number of rows converted from the DF at a time when writing a sheet
+WRITE_CHUNK_SIZE = 10000
+
+# Columns longer than this get their autofit width from an evenly spaced sample of this many rows
+WIDTH_SAMPLE_SIZE = 100000
+
+# Depth highlight colors, from the top level down. Deeper rows aren't highlighted.
+# https://www.ibm.com/design/language/resources/color-library/
+DEPTH_COLORS = [
+    {'bg_color': '#464646',
+     'font_color': 'white'},
+    {'bg_color': '#595859',
+     'font_color': 'white'},
+    {'bg_color': '#777677',
+     'font_color': 'white'},
+    {'bg_color': '#949394',
+     'font_color': 'black'},
+    {'bg_color': '#a6a5a6',
+     'font_color': 'black'},
+    {'bg_color': '#c0bfc0',
+     'font_color': 'black'},
+    {'bg_color': '#d8d8d8',
+     'font_color': 'black'},
+    {'bg_color': '#eaeaea',
+     'font_color': 'black'},
+    {'bg_color': 'white',
+     'font_color': 'black'},
+]
 
 
 class DFExport:
 
-    def __init__(self, output_file_name="output.xlsx"):
-        """ Create BOMExporter object. Use given output file name or default. """
+    def __init__(self, output_file_name="output.xlsx", constant_memory=False, conditional_highlight=False,
+                 output_format='xlsx'):
+        """ Create BOMExporter object. Use given output file name or default.
+
+        output_format picks how the sheets are written, one of OUTPUT_FORMATS. For xlsx, output_file_name can also
+        be a file-like object such as BytesIO, then the workbook is built in memory and written to it. For parquet,
+        feather and csv, output_file_name is a directory and each sheet is written to it as one file named after the
+        sheet, with whole columns at once. Only the printed columns (and index) are kept, all the formatting options
+        of add_sheet are ignored.
+
+        With constant_memory=True, each row is flushed to a temp file as soon as the next row is started, instead of
+        keeping every cell of the workbook in memory until write_book. Strings are then written inline instead of
+        in a shared string table, so the file is a bit bigger.
+
+        With conditional_highlight=True, highlight_depth colors the rows with one conditional format per depth on
+        the Depth column, instead of giving each cell a format for its depth. Cells only get their base (or indent)
+        format, and cell formats are only added to the workbook once used, so writing is faster and the styles and
+        sheet XML are smaller.
+        """
+
+        if output_format not in OUTPUT_FORMATS:
+            raise RuntimeError(f'Unknown output format {output_format}, expected one of {OUTPUT_FORMATS}')
 
         self.output_file_name = output_file_name
+        self.output_format = output_format
+        self.constant_memory = constant_memory
+        self.conditional_highlight = conditional_highlight
+
+        # Sheets of the plain data formats, kept until write_book
+        self.tables = {}
+
+        if output_format != 'xlsx':
+            self.workbook = None
+            return
+
+        # A file-like object can only be written to in memory (which overrides constant_memory)
+        in_memory = not isinstance(output_file_name, (str, os.PathLike))
 
         self.workbook = xlsxwriter.Workbook(self.output_file_name, {'nan_inf_to_errors': True,
                                                                     'default_date_format': 'dd/mm/yy',
-                                                                    'strings_to_numbers': True})
+                                                                    'strings_to_numbers': True,
+                                                                    'constant_memory': constant_memory,
+                                                                    'in_memory': in_memory})
 
         self.__load_default_style()
 
@@ -50,28 +128,6 @@ class DFExport:
         }
         self.header_format = self.workbook.add_format(header_style)
 
-        # https://www.ibm.com/design/language/resources/color-library/
-        depth_colors = [
-            {'bg_color': '#464646',
-             'font_color': 'white'},
-            {'bg_color': '#595859',
-             'font_color': 'white'},
-            {'bg_color': '#777677',
-             'font_color': 'white'},
-            {'bg_color': '#949394',
-             'font_color': 'black'},
-            {'bg_color': '#a6a5a6',
-             'font_color': 'black'},
-            {'bg_color': '#c0bfc0',
-             'font_color': 'black'},
-            {'bg_color': '#d8d8d8',
-             'font_color': 'black'},
-            {'bg_color': '#eaeaea',
-             'font_color': 'black'},
-            {'bg_color': 'white',
-             'font_color': 'black'},
-        ]
-
         cell_styles = {}
         for base, base_style in base_styles.items():
 
@@ -79,7 +135,7 @@ class DFExport:
 
             for depth in range(10):
                 # Get depth colors, or use default if out of range
-                colors = depth_colors[depth] if depth < len(depth_colors) else {}
+                colors = DEPTH_COLORS[depth] if depth < len(DEPTH_COLORS) else {}
 
                 highlight_style = {**base_style, **colors}
                 indent_style = {**base_style, 'indent': depth}
@@ -88,14 +144,43 @@ class DFExport:
                 cell_styles[(base, depth, 'indent')] = indent_style
                 cell_styles[(base, depth, 'indent_highlight')] = {**indent_style, **highlight_style}
 
+        self.cell_styles = cell_styles
         self.cell_format = {}
-        for cell_type, style in cell_styles.items():
-            self.cell_format[cell_type] = self.workbook.add_format(style)
+        self.highlight_format = {}
+
+        if self.conditional_highlight:
+            # Only the depth colors are given in conditional formats, the cell keeps its own border etc.
+            for depth, colors in enumerate(DEPTH_COLORS):
+                self.highlight_format[depth] = self.workbook.add_format(colors)
+        else:
+            for cell_type, style in cell_styles.items():
+                self.cell_format[cell_type] = self.workbook.add_format(style)
+
+    def __get_cell_format(self, cell_type):
+        """ Return the cell format for (base, depth, option), adding it to the workbook the first time it's used """
+        base, depth, option = cell_type
+        if option is None:
+            # Plain format is the same for all depths
+            cell_type = (base, None, None)
+
+        if cell_type not in self.cell_format:
+            self.cell_format[cell_type] = self.workbook.add_format(self.cell_styles[cell_type])
+        return self.cell_format[cell_type]
 
+    @instrument.timed('DFExport.add_sheet', rows_arg='df', detail_arg='sheet_name')
     def add_sheet(self, df, sheet_name="Sheet1", zoom=85, freeze_row=1, freeze_col=0, cols_to_print=None,
                   depth_col_name='', cols_to_indent=None, highlight_depth=False, highlight_col_limit=0,
-                  group_rows=False, print_index=True, col_formats={}, col_style={}):
-        """ Take DF and creates new sheet with various options. """
+                  group_rows=False, print_index=True, col_formats={}, col_style={}, col_widths=None):
+        """ Take DF and creates new sheet with various options.
+
+        col_widths takes a dict of column widths from get_col_widths, so sheets with the same columns (ex. of the
+        same BOM) don't need to work them out again. Widths of any other columns are still worked out.
+        """
+
+        # Plain data formats only keep the columns, they are written in write_book
+        if self.output_format != 'xlsx':
+            self.tables[sheet_name] = self.__get_table(df, cols_to_print, print_index)
+            return
 
         # Create output DF with only cols to print and replace N/A with empty string
         if cols_to_print:
@@ -126,113 +211,247 @@ class DFExport:
         for col_num, value in enumerate(output_df.columns.values):
             worksheet.write(0, col_num + index_col_offset, value, self.header_format)
 
-        # Iterate through DF rows and write to Excel file
-        for row_num in range(len(output_df)):
-
-            # Get the row depth (if needed for highlight, indent or grouping)
-            if highlight_depth or cols_to_indent or group_rows:
-                depth = int(df[depth_col_name].iloc[row_num])
-            else:
-                depth = None
-
-            format_option = 'highlight' if highlight_depth else None
-
-            # Write optional index first using highlighted or plain index format
-            print_format = self.cell_format[('index', depth, format_option)]
-            if print_index:
-                worksheet.write(row_num + 1, 0, output_df.index[row_num], print_format)
-
-            # Write rest of the row
-            for col_num in range(len(output_df.columns)):
-
-                col_name = output_df.columns[col_num]
-
-                # Check if column should be highlighted and/or indented
-                indent_col = cols_to_indent is not None and col_name in cols_to_indent
-                highlight_col = highlight_depth and \
-                                (highlight_col_limit == 0 or col_num < highlight_col_limit - index_col_offset)
-
-                # Choose the correct format option to use
-                if indent_col and highlight_col:
-                    format_option = 'indent_highlight'
-                elif indent_col:
-                    format_option = 'indent'
-                elif highlight_col:
-                    format_option = 'highlight'
-                else:
-                    format_option = None
-
-                # Get value from DF
-                df_value = output_df.iloc[row_num, col_num]
+        # Get the row depths (if needed for highlight, indent or grouping)
+        if highlight_depth or cols_to_indent or group_rows:
+            depths = df[depth_col_name].to_numpy(dtype='int64').tolist()
+        else:
+            depths = [None] * len(output_df)
+        row_depths = set(depths)
 
-                # Set as empty string if null - values could be lists also, hence the .any()
-                value = df_value if pd.notnull([df_value]).any() else ''
-                value_type = output_df.dtypes[col_num] if pd.notnull([df_value]).any() else None
+        # Highlight the depths with conditional formats on the Depth column if it's printed, otherwise per cell
+        conditional_highlight = highlight_depth and self.conditional_highlight and depth_col_name in output_df.columns
+        cell_highlight = highlight_depth and not conditional_highlight
 
-                # Write data as number or string
-                if col_formats.get(col_name)=='custom':
-                    worksheet.write(row_num + 1, col_num + index_col_offset, value,
-                                    custom_format[col_name])
+        # Autofit column width. Widths and row groups are set before any cells are written, so they also work when
+        # rows are flushed as they are written (constant_memory).
+        widths = dict(col_widths or {})
+        widths.update(self.get_col_widths(output_df[[col for col in output_df.columns if col not in widths]]))
 
-                elif value_type in ['float64'] or col_formats.get(col_name)=='float':
-                    worksheet.write_number(row_num + 1, col_num + index_col_offset, value,
-                                           self.cell_format[('float', depth, format_option)])
+        if print_index:
+            worksheet.set_column(0, 0, self.__get_width(output_df.index.to_series()) + 2)
+        for col_num, col_name in enumerate(output_df.columns):
+            worksheet.set_column(col_num + index_col_offset, col_num + index_col_offset, widths[col_name] + 2)
 
-                elif value_type in ['int64', 'Int64'] or col_formats.get(col_name)=='int':
-                    worksheet.write_number(row_num + 1, col_num + index_col_offset, value,
-                                           self.cell_format[('default', depth, format_option)])
+        # Set optional grouping of rows
+        if group_rows:
+            for row_num, depth in enumerate(depths):
+                if depth > 0:
+                    worksheet.set_row(row_num + 1, None, None, {'level': depth})
 
-                elif value_type in ['datetime64[ns]', '<M8[ns]'] or col_formats.get(col_name)=='date':
-                    worksheet.write_datetime(row_num + 1, col_num + index_col_offset, value,
-                                             self.cell_format[('date', depth, format_option)])
+        # Work out how each column is written up front: the write method and format (for each depth) for its null
+        # and non-null cells
+        col_writers = []
+        for col_num in range(len(output_df.columns)):
+
+            col_name = output_df.columns[col_num]
+
+            # Check if column should be highlighted and/or indented
+            indent_col = cols_to_indent is not None and col_name in cols_to_indent
+            highlight_col = cell_highlight and \
+                            (highlight_col_limit == 0 or col_num < highlight_col_limit - index_col_offset)
+
+            # Choose the correct format option to use
+            if indent_col and highlight_col:
+                format_option = 'indent_highlight'
+            elif indent_col:
+                format_option = 'indent'
+            elif highlight_col:
+                format_option = 'highlight'
+            else:
+                format_option = None
 
-                elif col_formats.get(col_name)=='string':
-                    worksheet.write_string(row_num + 1, col_num + index_col_offset, str(value),
-                                    self.cell_format[('default', depth, format_option)])
+            # Null cells are written as empty string, picked by col_formats only
+            writers = {}
+            for has_value, value_type in [(True, output_df.dtypes[col_num]), (False, None)]:
+                write_method, base, to_str = self.__get_write_method(worksheet, col_name, value_type, col_formats)
 
+                if base == 'custom':
+                    formats = {depth: custom_format[col_name] for depth in row_depths}
                 else:
-                    worksheet.write(row_num + 1, col_num + index_col_offset, str(value),
-                                           self.cell_format[('default', depth, format_option)])
+                    formats = {depth: self.__get_cell_format((base, depth, format_option)) for depth in row_depths}
+
+                writers[has_value] = (write_method, formats, to_str)
+
+            col_writers.append((col_num + index_col_offset, output_df.iloc[:, col_num], writers))
+
+        index_formats = {depth: self.__get_cell_format(('index', depth, 'highlight' if cell_highlight else None))
+                         for depth in row_depths}
+
+        if conditional_highlight and len(output_df):
+            # Same columns as highlighted per cell: the index and the columns before highlight_col_limit
+            last_col = len(output_df.columns) - 1 + index_col_offset
+            if highlight_col_limit:
+                last_col = min(last_col, highlight_col_limit - 1)
+
+            depth_col = xl_col_to_name(output_df.columns.get_loc(depth_col_name) + index_col_offset, col_abs=True)
+            for depth in sorted(row_depths):
+                if depth in self.highlight_format:
+                    worksheet.conditional_format(1, 0, len(output_df), last_col,
+                                                 {'type': 'formula',
+                                                  'criteria': f'={depth_col}2={depth}',
+                                                  'format': self.highlight_format[depth]})
+
+        # Write the cells row by row, so strings are added to the shared string table in the same order as always
+        # (and rows can be flushed in order with constant_memory). Values are converted to lists a chunk at a time.
+        for chunk_start in range(0, len(output_df), WRITE_CHUNK_SIZE):
+            chunk_end = min(chunk_start + WRITE_CHUNK_SIZE, len(output_df))
+
+            index_values = output_df.index[chunk_start:chunk_end].tolist()
+
+            chunk_writers = []
+            for excel_col, col_series, writers in col_writers:
+                chunk_series = col_series.iloc[chunk_start:chunk_end]
+                values = chunk_series.tolist()
+                chunk_writers.append((excel_col, values, self.__get_not_null(chunk_series, values), writers))
+
+            for chunk_row in range(chunk_end - chunk_start):
+                row_num = chunk_start + chunk_row
+                depth = depths[row_num]
+
+                # Write optional index first using highlighted or plain index format
+                if print_index:
+                    worksheet.write(row_num + 1, 0, index_values[chunk_row], index_formats[depth])
+
+                # Write rest of the row
+                for excel_col, values, not_null, writers in chunk_writers:
+                    if not_null[chunk_row]:
+                        write_method, formats, to_str = writers[True]
+                        value = values[chunk_row]
+                        write_method(row_num + 1, excel_col, str(value) if to_str else value, formats[depth])
+                    else:
+                        write_method, formats, to_str = writers[False]
+                        write_method(row_num + 1, excel_col, '', formats[depth])
+
+    @instrument.timed('DFExport.write_book')
+    def write_book(self):
+        """ Writes workbook to file after all sheets are added. """
+        if self.output_format != 'xlsx':
+            self.__write_tables()
+            return
 
-            # Set optional grouping of rows
-            if group_rows:
-                if depth > 0:
-                    worksheet.set_row(row_num + 1, None, None, {'level': depth})
+        # self.writer.save()
+        self.workbook.close()
 
-        # Autofit column width
-        for col_num, width in enumerate(self.__get_col_widths(output_df)):
+        # Rewind an in memory output so it can be read straight away
+        if hasattr(self.output_file_name, 'seek'):
+            self.output_file_name.seek(0)
+
+    def get_sheet_path(self, sheet_name):
+        """ Return the file path a sheet is written to with the plain data formats """
+        file_name = ''.join('_' if char in '\\/:*?"<>|' else char for char in sheet_name)
+        return os.path.join(self.output_file_name, f'{file_name}.{self.output_format}')
+
+    def __write_tables(self):
+        """ Write each sheet kept by add_sheet to its own file in the output directory """
+        if not os.path.exists(self.output_file_name):
+            os.makedirs(self.output_file_name)
+
+        for sheet_name, table in self.tables.items():
+            sheet_path = self.get_sheet_path(sheet_name)
+            if self.output_format == 'parquet':
+                table.to_parquet(sheet_path, index=False)
+            elif self.output_format == 'feather':
+                table.to_feather(sheet_path)
+            else:
+                table.to_csv(sheet_path, index=False)
 
-            # After the index column, check type and override width if necessary
-            if col_num > 0:
-                if output_df.dtypes[col_num - 1] in ['float64']:
-                    width = 8
-                elif output_df.dtypes[col_num - 1] in ['datetime64[ns]']:
-                    width = 8
-                elif width>80:
-                    width = 8
+    def __get_table(self, df, cols_to_print, print_index):
+        """ Return DF with the columns printed by add_sheet, with the index as its first column if printed. Object
+        columns the Arrow based formats can't store (ex. lists, or a mix of numbers and text) are converted to text,
+        the same way they are written to Excel. """
+        table = df[cols_to_print] if cols_to_print else df
 
-            # If not printing index, skip to the first column and offset
-            if not print_index:
-                if col_num == 0: continue
-                col_num -= 1
+        if print_index:
+            table = table.rename_axis('Index').reset_index()
+        else:
+            table = table.reset_index(drop=True)
 
-            worksheet.set_column(col_num, col_num, width + 2)
+        if self.output_format in ['parquet', 'feather']:
+            for col_name, col_series in table.items():
+                if col_series.dtype == object and \
+                        pd.api.types.infer_dtype(col_series, skipna=True) not in ARROW_INFERRED_TYPES:
+                    values = col_series.tolist()
+                    not_null = self.__get_not_null(col_series, values)
+                    table[col_name] = [str(value) if value_not_null else None
+                                       for value, value_not_null in zip(values, not_null)]
 
-    def write_book(self):
-        """ Writes workbook to file after all sheets are added. """
-        # self.writer.save()
-        self.workbook.close()
+        return table
 
     def add_raw_sheet(self, df, sheet_name):
         """ Add a sheet with default pandas formatting """
         # df.to_excel(self.writer, sheet_name=sheet_name, header=True, index=True)
         pass
 
-    def __get_col_widths(self, df):
-        """ Return max lengths for each column in DF """
-
-        # First we find the maximum length of the index column
-        idx_max = max([len(str(s)) for s in df.index.values])  # + [len(str(dataframe.index.name))])
-        # Then, we concatenate this to the max of the lengths of column name and its values for each column, left to right
-        # return [idx_max] + [max([len(str(s)) for s in dataframe[col].values] + [len(col)]) for col in dataframe.columns]
-        return [idx_max] + [max([len(str(s)) for s in df[col].values]) for col in df.columns]
+    @staticmethod
+    def __get_write_method(worksheet, col_name, value_type, col_formats):
+        """ Return worksheet write method, base cell format and if the value is written as str for a column with
+        given dtype (None for null cells) """
+        col_format = col_formats.get(col_name)
+
+        if col_format == 'custom':
+            return worksheet.write, 'custom', False
+        elif value_type in ['float64'] or col_format == 'float':
+            return worksheet.write_number, 'float', False
+        elif value_type in INT_DTYPES or col_format == 'int':
+            return worksheet.write_number, 'default', False
+        elif value_type in ['datetime64[ns]', '<M8[ns]'] or col_format == 'date':
+            return worksheet.write_datetime, 'date', False
+        elif col_format == 'string':
+            return worksheet.write_string, 'default', True
+        else:
+            return worksheet.write, 'default', True
+
+    @staticmethod
+    def __get_not_null(col_series, values):
+        """ Return list of which values in column are not null. A list value counts as not null if any of its
+        items is not null, so an empty list is written as an empty cell. """
+        not_null = col_series.notnull().tolist()
+
+        if col_series.dtype == object:
+            for row_num, value in enumerate(values):
+                if isinstance(value, (list, tuple, np.ndarray)):
+                    not_null[row_num] = bool(pd.notnull([value]).any())
+
+        return not_null
+
+    def get_col_widths(self, df):
+        """ Return dict with the autofit width of each column in DF: the length of its longest value as text, or 8
+        for float and date columns and columns with values longer than 80 """
+        col_widths = {}
+        for col_name, col_series in df.items():
+            if col_series.dtype in ['float64', 'datetime64[ns]']:
+                col_widths[col_name] = 8
+            else:
+                width = self.__get_width(col_series)
+                col_widths[col_name] = width if width <= 80 else 8
+        return col_widths
+
+    @staticmethod
+    def __get_width(col_series):
+        """ Return the length of the longest value in Series as text, same as max(len(str(value))) """
+        if len(col_series) > WIDTH_SAMPLE_SIZE:
+            col_series = col_series.iloc[np.linspace(0, len(col_series) - 1, WIDTH_SAMPLE_SIZE).astype('int64')]
+
+        if len(col_series) == 0:
+            return 0
+
+        # Integers - the longest text is either the smallest or the largest value. Nulls are written as <NA>.
+        if pd.api.types.is_integer_dtype(col_series.dtype):
+            not_null = col_series.dropna()
+            width = max(len(str(not_null.min())), len(str(not_null.max()))) if len(not_null) else 0
+            return max(width, 4) if len(not_null) < len(col_series) else width
+
+        # Categoricals - only the categories in use need to be converted to text
+        if isinstance(col_series.dtype, pd.CategoricalDtype):
+            codes = col_series.cat.codes.to_numpy()
+            categories = col_series.cat.categories[np.unique(codes[codes >= 0])]
+            width = categories.astype(str).str.len().max() if len(categories) else 0
+            return max(width, 3) if (codes < 0).any() else width
+
+        # Anything else - convert each distinct value to text (lists can't be deduplicated, so all of them)
+        values = col_series.to_numpy()
+        try:
+            values = pd.unique(values)
+        except TypeError:
+            pass
+        return int(pd.Series(values, dtype=object).astype(str).str.len().max())
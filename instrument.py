@@ -0,0 +1,210 @@
+""" Module with opt-in timing and memory instrumentation of the BOM pipeline stages
+
+Nothing is recorded until enable() is called, so the instrumented functions run as normal otherwise. Each stage
+records its wall time, peak traced memory (with tracemalloc) and row count. Stages inside other stages, ex.
+BOM.sort_df inside BOM.load_csv, are recorded under their parent so the report shows where the time went.
+
+    Typical usage example:
+    instrument.enable()
+    with instrument.stage('Load PO data') as po_stage:
+        po_df = load_po_data()
+        po_stage.rows = len(po_df)
+    instrument.write_report('profile.json')
+"""
+
+import contextlib
+import datetime
+import functools
+import inspect
+import json
+import os
+import time
+import tracemalloc
+
+_enabled = False
+_trace_memory = False
+_started = None
+_start_time = None
+_records = []
+_stack = []
+
+
+class Stage:
+    """ One recorded run of a pipeline stage
+
+        Attributes:
+            name: Stage name, ex. BOM.load_csv
+            detail: Extra description, ex. the sheet name for DFExport.add_sheet
+            depth: Number of stages this one ran inside of
+            parent: Name of the stage this one ran inside of
+            start: Seconds from enable() to the start of the stage
+            seconds: Wall time of the stage
+            peak_memory: Peak traced memory during the stage in bytes, None if memory isn't traced
+            memory_change: Traced memory at the end of the stage minus at the start, in bytes
+            rows: Number of rows the stage processed or returned, if known
+    """
+
+    def __init__(self, name, rows=None, detail=None):
+        self.name = name
+        self.detail = detail
+        self.rows = rows
+        self.depth = len(_stack)
+        self.parent = _stack[-1].name if _stack else None
+        self.start = None
+        self.seconds = None
+        self.peak_memory = None
+        self.memory_change = None
+
+    def to_dict(self):
+        mb = 1024 * 1024
+        return {'name': self.name,
+                'detail': self.detail,
+                'parent': self.parent,
+                'depth': self.depth,
+                'start': round(self.start, 6),
+                'seconds': round(self.seconds, 6),
+                'peak_memory_mb': None if self.peak_memory is None else round(self.peak_memory / mb, 3),
+                'memory_change_mb': None if self.memory_change is None else round(self.memory_change / mb, 3),
+                'rows': None if self.rows is None else int(self.rows)}
+
+
+def enable(trace_memory=True):
+    """ Start recording stages, clearing anything recorded before
+
+    Args:
+        trace_memory (bool, optional): Record peak memory with tracemalloc. This slows the run down, turn off to
+            only record times.
+    """
+    global _enabled, _trace_memory, _started, _start_time
+    reset()
+    _enabled = True
+    _trace_memory = trace_memory
+    _started = datetime.datetime.now()
+    _start_time = time.perf_counter()
+
+    if trace_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+def disable():
+    """ Stop recording stages. Recorded stages are kept for the report. """
+    global _enabled
+    _enabled = False
+    if _trace_memory and tracemalloc.is_tracing():
+        tracemalloc.stop()
+
+
+def is_enabled():
+    return _enabled
+
+
+def reset():
+    """ Clear the recorded stages """
+    _records.clear()
+    _stack.clear()
+
+
+@contextlib.contextmanager
+def stage(name, rows=None, detail=None):
+    """ Context manager that records the code inside it as a stage. Set .rows on the yielded Stage if the row count
+    is only known at the end. Does nothing unless enable() was called. """
+    current_stage = Stage(name, rows, detail)
+    if not _enabled:
+        yield current_stage
+        return
+
+    if _trace_memory:
+        # The peak so far belongs to the parent stage, then start a new peak for this stage
+        memory, peak = tracemalloc.get_traced_memory()
+        if _stack:
+            _stack[-1].peak_memory = max(_stack[-1].peak_memory, peak)
+        if hasattr(tracemalloc, 'reset_peak'):
+            tracemalloc.reset_peak()
+        start_memory = memory
+        current_stage.peak_memory = memory
+
+    _records.append(current_stage)
+    _stack.append(current_stage)
+    current_stage.start = time.perf_counter() - _start_time
+    try:
+        yield current_stage
+    finally:
+        current_stage.seconds = time.perf_counter() - _start_time - current_stage.start
+        _stack.pop()
+
+        if _trace_memory:
+            memory, peak = tracemalloc.get_traced_memory()
+            current_stage.peak_memory = max(current_stage.peak_memory, peak)
+            current_stage.memory_change = memory - start_memory
+            if _stack:
+                _stack[-1].peak_memory = max(_stack[-1].peak_memory, current_stage.peak_memory)
+
+
+def timed(name=None, rows=None, rows_arg=None, detail_arg=None):
+    """ Decorator that records each call of the function as a stage
+
+    Args:
+        name (str, optional): Stage name. Defaults to the function's qualified name, ex. BOMCreator.add_mnp_sheet.
+        rows (function, optional): Gives the row count from the return value, ex. len for a function returning a
+            DataFrame
+        rows_arg (str, optional): Name of the argument whose length is the row count, ex. 'df'
+        detail_arg (str, optional): Name of the argument to show as the stage detail, ex. 'sheet_name'
+    """
+
+    def decorator(func):
+        stage_name = name or func.__qualname__
+        signature = inspect.signature(func)
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not _enabled:
+                return func(*args, **kwargs)
+
+            arguments = signature.bind(*args, **kwargs)
+            arguments.apply_defaults()
+            row_count = len(arguments.arguments[rows_arg]) if rows_arg else None
+            detail = arguments.arguments[detail_arg] if detail_arg else None
+
+            with stage(stage_name, rows=row_count, detail=detail) as current_stage:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    current_stage.rows = rows(result)
+                return result
+
+        return wrapper
+
+    return decorator
+
+
+def get_report():
+    """ Return the recorded stages as a dict, with a summary of the total time, calls and rows per stage name """
+    summary = {}
+    for record in _records:
+        totals = summary.setdefault(record.name, {'name': record.name, 'calls': 0, 'seconds': 0, 'rows': None,
+                                                  'peak_memory_mb': None})
+        totals['calls'] += 1
+        totals['seconds'] += record.seconds or 0
+        if record.rows is not None:
+            totals['rows'] = (totals['rows'] or 0) + int(record.rows)
+        if record.peak_memory is not None:
+            totals['peak_memory_mb'] = max(totals['peak_memory_mb'] or 0, round(record.peak_memory / 1024 / 1024, 3))
+
+    for totals in summary.values():
+        totals['seconds'] = round(totals['seconds'], 6)
+
+    return {'started': _started.isoformat(timespec='seconds') if _started else None,
+            'seconds': round(time.perf_counter() - _start_time, 6) if _start_time else None,
+            'peak_memory_mb': max((s['peak_memory_mb'] or 0 for s in summary.values()), default=None)
+            if _trace_memory else None,
+            'summary': sorted(summary.values(), key=lambda totals: totals['seconds'], reverse=True),
+            'stages': [record.to_dict() for record in _records if record.seconds is not None]}
+
+
+def write_report(file_path):
+    """ Write the JSON report of the recorded stages to file_path """
+    report_dir = os.path.dirname(file_path)
+    if report_dir and not os.path.exists(report_dir):
+        os.makedirs(report_dir)
+
+    with open(file_path, 'w') as f:
+        json.dump(get_report(), f, indent=2, default=str)
@@ -0,0 +1,187 @@
+""" Module used to cache MISys query results on disk
+
+Each cached query result is a Parquet file named after the query's cache name (ex. PO_TABLE). The file metadata
+holds a hash of the SQL query, the time the data was fetched and the row count, so a stale or different query is
+never mistaken for the cached one. Results can be written a chunk at a time as they are fetched, and only the
+columns asked for are read from disk. The cache directory is kept under a size limit by evicting the least recently
+used entries.
+
+    Typical usage example:
+    cache = MisysCache()
+    cache.save('PO_TABLE', df, query=sql)
+    df = cache.load('PO_TABLE', columns=['PO Number', 'Job ID'], query=sql)
+"""
+
+import datetime
+import hashlib
+import json
+import os
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.parquet as pq
+import instrument
+
+# Key of the cache entry info in the Parquet file metadata
+METADATA_KEY = b'misys_cache'
+
+
+def get_arrow_schema(df):
+    """ Return Arrow schema for DF from its column dtypes rather than its values, with object columns as strings. A
+    text column with no values in the first chunk would otherwise be null or double, and a later chunk with text
+    wouldn't fit. """
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    for col_num, dtype in enumerate(df.dtypes):
+        if dtype == object:
+            schema = schema.set(col_num, schema.field(col_num).with_type(pa.string()))
+    return schema
+
+
+class MisysCache:
+    """ Store of MISys query results as Parquet files with metadata
+
+        Attributes:
+            cache_dir: Directory that holds the cached Parquet files
+            size_limit: Max total size of the cache directory in MB. Least recently used entries are removed past this.
+    """
+
+    def __init__(self, cache_dir='cache/misys', size_limit=500):
+        self.cache_dir = cache_dir
+        self.size_limit = size_limit
+
+    @staticmethod
+    def get_query_hash(query):
+        """ Return hash of SQL query text, None if no query given """
+        if query is None:
+            return None
+        return hashlib.sha256(query.encode()).hexdigest()
+
+    def get_info(self, name, query=None):
+        """ Return dict with the info of a cache entry: name, query_hash, fetched (ISO time), rows, columns and any
+        extra_info it was saved with. Only reads the file footer. Returns None if not in cache, or if query is given
+        and the entry was saved for a different query. """
+        cache_path = self.__cache_path(name)
+        if not os.path.exists(cache_path):
+            return None
+
+        try:
+            file_metadata = pq.read_metadata(cache_path)
+            info = json.loads((file_metadata.metadata or {})[METADATA_KEY])
+            info['rows'] = file_metadata.num_rows
+        except (KeyError, ValueError, OSError, pa.ArrowException):
+            # Not written by this cache or half written, ignore it
+            return None
+
+        if query is not None and info['query_hash'] != self.get_query_hash(query):
+            return None
+        return info
+
+    def age(self, name):
+        """ Return hours since the cached data was fetched from MISys, None if not in cache. Based on the fetch time
+        in the metadata, not the file time, which is touched whenever the entry is read. """
+        info = self.get_info(name)
+        if info is None:
+            return None
+        fetched = datetime.datetime.fromisoformat(info['fetched'])
+        return (datetime.datetime.now() - fetched).total_seconds() / (60 * 60)
+
+    @instrument.timed('MisysCache.load', rows=lambda df: 0 if df is None else len(df))
+    def load(self, name, columns=None, query=None):
+        """ Return cached DF for given name, with only the given columns if any. Returns None if not in cache, or
+        if query is given and the entry was saved for a different query. """
+        if self.get_info(name, query) is None:
+            return None
+
+        cache_path = self.__cache_path(name)
+
+        # Touch the file so eviction knows it was recently used
+        os.utime(cache_path)
+
+        return pd.read_parquet(cache_path, columns=columns)
+
+    @instrument.timed('MisysCache.save', rows_arg='df')
+    def save(self, name, df, query=None, fetched=None, extra_info=None):
+        """ Save DF under given name with the query it came from, then evict old entries if the cache is over the size
+        limit
+
+        Args:
+            name (str): Cache name, ex. PO_TABLE
+            df (DataFrame): Query results
+            query (str, optional): SQL query of the results. Loading with a different query is a cache miss.
+            fetched (datetime, optional): When the data was fetched from MISys. Defaults to now.
+            extra_info (dict, optional): Other JSON serializable info to keep with the entry, see get_info
+        """
+        self.save_chunks(name, [df], query=query, fetched=fetched, extra_info=extra_info)
+
+    @instrument.timed('MisysCache.save_chunks', rows=lambda rows: rows)
+    def save_chunks(self, name, chunks, query=None, fetched=None, extra_info=None):
+        """ Same as save, but takes an iterable of DFs (ex. query results fetched a chunk at a time) and writes each
+        one as soon as it comes, so they never all have to be in memory. Every chunk must have the same columns and
+        dtypes, the Parquet schema is made from the dtypes of the first one. Returns the number of rows saved. """
+        if not os.path.exists(self.cache_dir):
+            os.makedirs(self.cache_dir)
+
+        info = {'name': name,
+                'query_hash': self.get_query_hash(query),
+                'fetched': (fetched or datetime.datetime.now()).isoformat(timespec='seconds'),
+                **(extra_info or {})}
+
+        # Write to temp file and then move, so a crash never leaves a half written cache entry
+        cache_path = self.__cache_path(name)
+        temp_path = f'{cache_path}.{os.getpid()}.tmp'
+
+        writer = None
+        rows = 0
+        try:
+            for chunk in chunks:
+                if writer is None:
+                    table = pa.Table.from_pandas(chunk, schema=get_arrow_schema(chunk), preserve_index=False)
+                    info['columns'] = [str(col) for col in chunk.columns]
+                    schema = table.schema.with_metadata({**(table.schema.metadata or {}),
+                                                         METADATA_KEY: json.dumps(info)})
+                    writer = pq.ParquetWriter(temp_path, schema)
+                else:
+                    table = pa.Table.from_pandas(chunk, schema=writer.schema, preserve_index=False)
+
+                writer.write_table(table)
+                rows += len(chunk)
+
+            if writer is None:
+                raise RuntimeError(f'No data to save in cache entry {name}')
+            writer.close()
+
+        except:
+            if writer is not None:
+                writer.close()
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+        os.replace(temp_path, cache_path)
+
+        self.evict(keep=cache_path)
+        return rows
+
+    def evict(self, keep=None):
+        """ Remove least recently used entries until the cache is under the size limit. The entry at file path keep
+        (ex. the one just saved) is never removed. """
+        entries = [os.path.join(self.cache_dir, f) for f in os.listdir(self.cache_dir) if f.endswith('.parquet')]
+        entries.sort(key=os.path.getmtime)
+
+        total_size = sum(os.path.getsize(f) for f in entries)
+        while entries and total_size > self.size_limit * 1024 * 1024:
+            oldest = entries.pop(0)
+            if oldest == keep:
+                continue
+            total_size -= os.path.getsize(oldest)
+            os.remove(oldest)
+
+    def clear(self):
+        """ Remove all cached query results """
+        if os.path.exists(self.cache_dir):
+            for f in os.listdir(self.cache_dir):
+                if f.endswith('.parquet'):
+                    os.remove(os.path.join(self.cache_dir, f))
+
+    def __cache_path(self, name):
+        return os.path.join(self.cache_dir, f'{name}.parquet')
@@ -3,95 +3,399 @@ https://www.microsoft.com/en-us/download/details.aspx?id=56567
 https://www.microsoft.com/en-us/sql-server/developer-get-started/python/windows/"""
 
 import pandas as pd
-import pyodbc
 import dfexporter
 import numpy as np
-import os
-import warnings
+import contextlib
 import datetime
+import decimal
+import warnings
 import easygui
+import instrument
+import misyscache
+import misysreplica
+
+# Columns of the PO data, as (table, column, name)
+PO_DATA_COLUMNS = [('MIPOD', 'pohId', 'PO Number'),
+                   ('MIPOH', 'name', 'Supplier'),
+                   ('MIPOD', 'lineNbr', 'PO Line Number'),
+                   ('MIPOD', 'dStatus', 'Status'),
+                   ('MIPOD', 'jobId', 'Job ID'),
+                   ('MIPOD', 'itemId', 'Item Number'),
+                   ('MIPOD', 'viCode', 'Misc Item Number'),
+                   ('MIPOD', 'descr', 'Description'),
+                   ('MIPOD', 'cmt', 'Comment'),
+                   ('MIPOD', 'ordered', 'Qty Ordered'),
+                   ('MIPOD', 'received', 'Qty Recd'),
+                   ('MIPOD', 'poUOfM', 'UOM'),
+                   ('MIPOD', 'poXStk', 'UOM Conversion'),
+                   ('MIPOD', 'price', 'Unit Price'),
+                   ('MIPOD', 'initDueDt', 'Initial Due Date'),
+                   ('MIPOD', 'realDueDt', 'Actual Due Date'),
+                   ('MIPOD', 'promisedDt', 'Promised Date'),
+                   ('MIPOD', 'lastRecvDt', 'Date Last Recd'),
+                   ('MIPOD', 'dType', 'Data Type'),
+                   ('MIPOD', 'locId', 'Location ID')]
+
+# Rows fetched from the DB at a time. Each chunk is cleaned up and written to the cache before the next is fetched.
+FETCH_CHUNK_SIZE = 50000
+
+# Part numbers per query when filtering PO lines by part number. Each adds two LIKE conditions (and parameters) to
+# the WHERE clause, which is kept well under the SQL Server limit of 2100 parameters and SQLite's expression depth.
+FILTER_BATCH_SIZE = 200
+
+# Idle DB connections kept open for reuse, per connection
+CONNECTION_POOL_SIZE = 2
+
+# Kind of values (as named by pandas infer_dtype) for each column type the DB driver gives
+SQL_TYPE_KINDS = {int: 'integer',
+                  float: 'floating',
+                  decimal.Decimal: 'decimal',
+                  bool: 'boolean',
+                  datetime.datetime: 'datetime',
+                  datetime.date: 'date',
+                  str: 'string'}
+
+# pandas dtype for each kind of values, so every chunk of a query gets the same dtypes. Anything else is object.
+KIND_DTYPES = {'integer': 'Int64',
+               'floating': 'float64',
+               'mixed-integer-float': 'float64',
+               'decimal': 'float64',
+               'boolean': 'boolean',
+               'datetime': 'datetime64[ns]',
+               'datetime64': 'datetime64[ns]',
+               'date': 'datetime64[ns]'}
+
+# Idle DB connections, by connection string (or connection_factory)
+_connection_pool = {}
 
 
 class MisysTable:
 
-    def __init__(self, force_update=False, cache_age_limit=24):
+    def __init__(self, force_update=False, cache_age_limit=24, cache_size_limit=500, delta_sync=False,
+                 connection_factory=None, fetch_chunk_size=FETCH_CHUNK_SIZE):
+        """ Create MisysTable object
+
+        With delta_sync=True, the PO data is queried from the local replica of the MIPOH and MIPOD tables (see
+        misysreplica.py). Each load only fetches the rows changed since the last one (by their rowVer), instead of the
+        whole join whenever the cache is older than cache_age_limit hours. Without it, the replica is still used for
+        the PO data if it can't be read from the DB or cache.
+
+        connection_factory is a function returning a new DB-API connection to use instead of the MISys server, ex.
+        lambda: sqlite3.connect('misys.db') for a local SQLite stand-in with the same tables.
+
+        fetch_chunk_size is the number of rows fetched from the DB at a time, see iter_sql.
+        """
         self.server = '192.168.75.21,1500'
         self.database = 'DSS'
-        self.cache_dir = 'cache'
+        self.cache_dir = 'cache/misys'
         self.cache_age_limit = cache_age_limit
         self.username = 'exporter'
         self.password = 'password'
         self.force_update = force_update
-
-    def load_sql(self, sql, cache_name):
-        """ Connect to MISys DB, run SQL query and return results as DF """
-
-        if self.force_update or not self.check_for_cache(cache_name) \
+        self.delta_sync = delta_sync
+        self.connection_factory = connection_factory
+        self.fetch_chunk_size = fetch_chunk_size
+        self.cache = misyscache.MisysCache(self.cache_dir, size_limit=cache_size_limit)
+        self.replica = misysreplica.MisysReplica(f'{self.cache_dir}/misys.db')
+
+    def get_connection_string(self):
+        return (r'DRIVER={ODBC Driver 17 for SQL Server};'
+                f'SERVER={self.server};'
+                f'DATABASE={self.database};'
+                f'UID={self.username};'
+                f'PWD={self.password};')
+
+    def connect(self):
+        """ Return new connection to MISys DB """
+        if self.connection_factory is not None:
+            return self.connection_factory()
+
+        # Only needed for the real MISys server, not for a connection_factory
+        import pyodbc
+        return pyodbc.connect(self.get_connection_string(), timeout=5)
+
+    @contextlib.contextmanager
+    def connection(self):
+        """ Context manager giving a DB connection from the pool, or a new one if none are idle. The connection goes
+        back to the pool afterwards, also when a generator using it is closed early, unless there was an error with it
+        open, then it's closed in case it's broken. """
+        pool = _connection_pool.setdefault(self.connection_factory or self.get_connection_string(), [])
+        cnxn = pool.pop() if pool else self.connect()
+
+        reuse = True
+        try:
+            yield cnxn
+        except Exception:
+            reuse = False
+            cnxn.close()
+            raise
+        finally:
+            if reuse and len(pool) < CONNECTION_POOL_SIZE:
+                pool.append(cnxn)
+            elif reuse:
+                cnxn.close()
+
+    def iter_sql(self, sql, params=None, chunk_size=None):
+        """ Run SQL query and yield the results as DFs of up to chunk_size rows (defaults to fetch_chunk_size), so
+        the whole result set is never in memory at once. Every chunk gets the same dtypes (see KIND_DTYPES), empty
+        strings are NaN and rowVer is dropped. Always yields at least one DF, empty if there are no results. """
+        with self.connection() as cnxn:
+            yield from self.__iter_results(cnxn, sql, params, chunk_size or self.fetch_chunk_size)
+
+    def read_sql(self, sql, params=None):
+        """ Run SQL query and return all results as one DF, see iter_sql """
+        return pd.concat(self.iter_sql(sql, params), ignore_index=True)
+
+    def read_replica_sql(self, sql, params=None):
+        """ Run SQL query on the local replica (see misysreplica.py) and return all results as one DF, with the same
+        dtypes as read_sql """
+        with contextlib.closing(self.replica.connect()) as cnxn:
+            return pd.concat(self.__iter_results(cnxn, sql, params, self.fetch_chunk_size), ignore_index=True)
+
+    def __iter_results(self, cnxn, sql, params, chunk_size):
+        cursor = cnxn.cursor()
+        try:
+            cursor.execute(sql, params or [])
+            columns = [col[0] for col in cursor.description]
+
+            dtypes = None
+            while True:
+                rows = cursor.fetchmany(chunk_size)
+                chunk = pd.DataFrame.from_records([tuple(row) for row in rows], columns=columns)
+
+                # Dtypes are worked out from the first chunk and kept for the rest
+                if dtypes is None:
+                    dtypes = self.__get_dtypes(chunk, [col[1] for col in cursor.description])
+
+                yield self.__coerce_chunk(chunk, dtypes)
+
+                if len(rows) < chunk_size:
+                    break
+        finally:
+            # Also when closed early, so the connection isn't left busy with the rest of the results
+            cursor.close()
+
+    @staticmethod
+    def __get_dtypes(chunk, sql_types):
+        """ Return dict of the dtype for each column, from the column type given by the DB driver. If the driver
+        doesn't give one (ex. SQLite), it's worked out from the values in the chunk. """
+        dtypes = {}
+        for col_name, sql_type in zip(chunk.columns, sql_types):
+            kind = SQL_TYPE_KINDS.get(sql_type) or pd.api.types.infer_dtype(chunk[col_name], skipna=True)
+            dtypes[col_name] = KIND_DTYPES.get(kind, 'object')
+        return dtypes
+
+    @staticmethod
+    def __coerce_chunk(chunk, dtypes):
+        """ Return chunk with the given dtypes, empty strings as NaN and without rowVer. rowVer is an oddball column
+        that causes encoding errors - BE GONE! """
+        columns = {}
+        for col_name, dtype in dtypes.items():
+            col_series = chunk[col_name]
+
+            if col_name == 'rowVer':
+                continue
+            elif dtype == 'object':
+                if pd.api.types.infer_dtype(col_series, skipna=True) not in ['string', 'empty']:
+                    col_series = col_series.map(lambda value: value if isinstance(value, str) or pd.isnull(value)
+                                                else str(value))
+                # Stays object when every value is empty, replace alone would make it float
+                columns[col_name] = col_series.replace('', np.nan).astype('object')
+            elif dtype == 'datetime64[ns]':
+                columns[col_name] = pd.to_datetime(col_series, errors='coerce')
+            elif dtype == 'boolean':
+                columns[col_name] = col_series.astype('boolean')
+            else:
+                columns[col_name] = pd.to_numeric(col_series, errors='coerce').astype(dtype)
+
+        return pd.DataFrame(columns, index=chunk.index)
+
+    @instrument.timed('MisysTable.load_sql', rows=len, detail_arg='cache_name')
+    def load_sql(self, sql, cache_name, columns=None, params=None):
+        """ Connect to MISys DB, run SQL query (with ? placeholders for params, if any) and return results as DF.
+        Results are cached under cache_name for cache_age_limit hours. Only the given columns are read back from
+        the cache, if any. """
+
+        # The cached results are only reused for the same query and parameters
+        query = sql if params is None else f'{sql} -- {list(params)}'
+
+        if self.force_update or not self.check_for_cache(cache_name, query) \
                 or self.cache_age(cache_name) > self.cache_age_limit:
             try:
                 print('Fetching MISys data from database')
-                # Connect to DB
-                cnxn = pyodbc.connect(r'DRIVER={ODBC Driver 17 for SQL Server};'
-                                      f'SERVER={self.server};'
-                                      f'DATABASE={self.database};'
-                                      f'UID={self.username};'
-                                      f'PWD={self.password};', timeout=5)
-
-                # Run SELECT sql query and load into DF
-                df = pd.read_sql(sql, cnxn)
-
-                # rowVer is an oddball column that causes encoding errors - BE GONE!
-                if 'rowVer' in df.columns:
-                    df.drop(columns=['rowVer'], inplace=True)
-
-                # Replace empty strings with nan
-                df.replace('', np.nan, regex=True, inplace=True)
-
-                self.save_cache(df, cache_name)
-                return df
+                # Stream the results into the cache a chunk at a time, then read back only the columns needed
+                self.cache.save_chunks(cache_name, self.iter_sql(sql, params), query=query)
+                return self.read_cache(cache_name, columns, query)
 
             except:
-                if self.check_for_cache(cache_name):
+                if self.check_for_cache(cache_name, query):
                     warnings.warn('Could not connect to DB, using outdated cache data that is '
                                   f'{self.cache_age(cache_name):.2f} hours old.')
-                    return self.read_cache(cache_name)
+                    return self.read_cache(cache_name, columns, query)
                 else:
                     raise Exception('Cannot read data from DB or cache!!')
 
-        elif self.check_for_cache(cache_name):
+        elif self.check_for_cache(cache_name, query):
             print('Fetching MISys data from cache')
-            return self.read_cache(cache_name)
+            return self.read_cache(cache_name, columns, query)
 
         else:
             raise Exception('Cannot read data from DB or cache!!')
 
-    def fetch_po_data(self, row_limit=None):
-        """ Canned SQL that gets PO line item data from MIPOH and MIPOD tables """
-        sql = (f'SELECT {f"TOP {row_limit}" if row_limit else ""} '
-               'MIPOD.[pohId] AS [PO Number], '
-               'MIPOH.[name] AS [Supplier], '
-               'MIPOD.[lineNbr] AS [PO Line Number], '
-               'MIPOD.[dStatus] AS Status, '
-               'MIPOD.[jobId] AS [Job ID], '
-               'MIPOD.[itemId] AS [Item Number], '
-               'MIPOD.[viCode] AS [Misc Item Number], '
-               'MIPOD.[descr] AS [Description], '
-               'MIPOD.[cmt] AS [Comment], '
-               'MIPOD.[ordered] AS [Qty Ordered], '
-               'MIPOD.[received] AS [Qty Recd], '
-               'MIPOD.[poUOfM] AS UOM, '
-               'MIPOD.[poXStk] AS [UOM Conversion], '
-               'MIPOD.[price] AS [Unit Price], '
-               'MIPOD.[initDueDt] AS [Initial Due Date], '
-               'MIPOD.[realDueDt] AS [Actual Due Date], '
-               'MIPOD.[promisedDt] AS [Promised Date], '
-               'MIPOD.[lastRecvDt] AS [Date Last Recd], '
-               'MIPOD.[dType] AS [Data Type], '
-               'MIPOD.[locId] AS [Location ID] '
-               'FROM MIPOH RIGHT JOIN MIPOD ON MIPOH.pohId = MIPOD.pohId '
-               'ORDER BY MIPOD.[pohId] DESC, MIPOD.[lineNbr] ASC')
-
-        return self.load_sql(sql, 'PO_TABLE')
+    def fetch_po_data(self, row_limit=None, part_numbers=None, jobs=None):
+        """ Canned SQL that gets PO line item data from MIPOH and MIPOD tables
+
+        With part_numbers and/or jobs, only the PO lines for them are fetched, with the filters in the query's WHERE
+        clause instead of filtering the whole table afterwards. See fetch_filtered_po_data.
+
+        With delta_sync, or if the data can't be read from the DB or cache, it's queried from the local replica
+        instead, see query_po_replica.
+        """
+        if self.delta_sync:
+            self.sync_po_replica()
+            return self.query_po_replica(row_limit, part_numbers, jobs)
+
+        try:
+            if part_numbers is not None or jobs is not None:
+                df = self.fetch_filtered_po_data(part_numbers, jobs)
+                return df.head(row_limit) if row_limit else df
+
+            columns = ', '.join(f'{table}.[{col}] AS [{name}]' for table, col, name in PO_DATA_COLUMNS)
+            sql = (f'SELECT {f"TOP {row_limit}" if row_limit else ""} {columns} '
+                   'FROM MIPOH RIGHT JOIN MIPOD ON MIPOH.pohId = MIPOD.pohId '
+                   'ORDER BY MIPOD.[pohId] DESC, MIPOD.[lineNbr] ASC')
+
+            return self.load_sql(sql, 'PO_TABLE')
+
+        except Exception:
+            if not self.replica.is_synced(misysreplica.REPLICA_TABLES):
+                raise
+            warnings.warn('Could not read PO data from DB or cache, using local replica last synced '
+                          f'{self.replica.age("MIPOD"):.2f} hours ago.')
+            return self.query_po_replica(row_limit, part_numbers, jobs)
+
+    def fetch_filtered_po_data(self, part_numbers=None, jobs=None):
+        """ Return PO data for only the given part numbers and/or jobs, in the same format as fetch_po_data
+
+        The filters are sent as parameterized WHERE clauses, with the part numbers split into batches of
+        FILTER_BATCH_SIZE queries. MISys item numbers can have the revision after the part number, so PO lines are
+        matched on item numbers starting with a part number (ex. 123F4567-1 matches 123F4567-1 REV A, but also
+        123F4567-10). Filter the Product Number after splitting off the revision for exact matches, see load_po_data.
+        Each batch is cached on its own.
+
+        Args:
+            part_numbers (list, optional): Part numbers, ex. the Part Number column of a processed BOM
+            jobs (list, optional): Job IDs
+        """
+        dfs = []
+        for sql, params in self.__get_po_queries(part_numbers, jobs):
+            cache_name = f'PO_TABLE_{self.cache.get_query_hash(f"{sql} -- {params}")[:16]}'
+            dfs.append(self.load_sql(sql, cache_name, params=params))
+
+        return self.__combine_po_batches(dfs)
+
+    def __get_po_queries(self, part_numbers=None, jobs=None):
+        """ Return list of (SQL, params) of the batches of PO data queries for given part numbers and/or jobs, see
+        fetch_filtered_po_data. The SQL works in both MISys and the local replica. """
+        columns = ', '.join(f'{table}.[{col}] AS [{name}]' for table, col, name in PO_DATA_COLUMNS)
+        # Same join as fetch_po_data, written from MIPOD so the filters on it can use its indexes
+        sql = f'SELECT {columns} FROM MIPOD LEFT JOIN MIPOH ON MIPOH.pohId = MIPOD.pohId WHERE '
+
+        job_filter, job_params = '', []
+        if jobs is not None:
+            jobs = sorted(set(jobs))
+            job_filter = f'MIPOD.[jobId] IN ({", ".join("?" * len(jobs))}) AND ' if jobs else '1 = 0 AND '
+            job_params = jobs
+
+        if part_numbers is None:
+            batches = [None]
+        else:
+            part_numbers = sorted(set(pn for pn in part_numbers if isinstance(pn, str) and pn))
+            batches = [part_numbers[start:start + FILTER_BATCH_SIZE]
+                       for start in range(0, len(part_numbers), FILTER_BATCH_SIZE)] or [[]]
+
+        queries = []
+        for batch in batches:
+            if batch is None:
+                queries.append((f'{sql}{job_filter}1 = 1', job_params))
+            elif batch:
+                part_filter = ' OR '.join(["MIPOD.[itemId] LIKE ? ESCAPE '\\' OR MIPOD.[viCode] LIKE ? ESCAPE '\\'"]
+                                          * len(batch))
+                queries.append((f'{sql}{job_filter}({part_filter})',
+                                job_params + [param for pn in batch for param in [self.__like_prefix(pn)] * 2]))
+            else:
+                queries.append((f'{sql}1 = 0', []))
+
+        return queries
+
+    @staticmethod
+    def __combine_po_batches(dfs):
+        """ Return one DF of PO data from the DFs of each query batch, sorted like fetch_po_data """
+        # A PO line can match part numbers in two batches, one on the item number and one on the misc item number
+        df = pd.concat(dfs, ignore_index=True).drop_duplicates(subset=['PO Number', 'PO Line Number'])
+        return df.sort_values(['PO Number', 'PO Line Number'], ascending=[False, True]).reset_index(drop=True)
+
+    @staticmethod
+    def __like_prefix(value):
+        """ Return LIKE pattern (with \\ as the escape character) matching text starting with value """
+        for char in ['\\', '%', '_', '[']:
+            value = value.replace(char, f'\\{char}')
+        return f'{value}%'
+
+    def sync_po_replica(self):
+        """ Bring the local replica of the MIPOH and MIPOD tables up to date, see sync_table """
+        for table in misysreplica.REPLICA_TABLES:
+            self.sync_table(table)
+
+    @instrument.timed('MisysTable.query_po_replica', rows=len)
+    def query_po_replica(self, row_limit=None, part_numbers=None, jobs=None):
+        """ Return PO data from the local replica as is, in the same format as fetch_po_data. The join and the part
+        number and job filters run in SQLite against the replica's indexes, the same way as in MISys. """
+        limit = f' ORDER BY MIPOD.[pohId] DESC, MIPOD.[lineNbr] ASC LIMIT {int(row_limit)}' if row_limit else ''
+        df = self.__combine_po_batches([self.read_replica_sql(f'{sql}{limit}', params)
+                                        for sql, params in self.__get_po_queries(part_numbers, jobs)])
+        return df.head(row_limit) if row_limit else df
+
+    @instrument.timed('MisysTable.sync_table', rows=lambda rows: rows, detail_arg='table')
+    def sync_table(self, table):
+        """ Bring the local replica of a MISys table up to date and return its number of rows
+
+        Only rows with a rowVer above the high water of the last sync are fetched, a chunk at a time, and upserted by
+        the table's primary key. rowVer is kept as an integer. Rows from MIN_ACTIVE_ROWVERSION() up are left for the
+        next sync, since an open transaction can still commit rows below the highest rowVer already committed. Rows
+        deleted in MISys are found by comparing row counts, and only then are the keys fetched to drop them. With
+        force_update, the whole table is fetched again. If the DB can't be reached, the replica is used as is.
+        """
+        key_cols = misysreplica.REPLICA_TABLES[table]
+        info = self.replica.get_info(table)
+        high_water = info['high_water'] if info and not self.force_update else 0
+
+        try:
+            # Every rowVer below this one is committed, it's where the next sync starts
+            min_active = int(self.read_sql('SELECT CAST(MIN_ACTIVE_ROWVERSION() AS BIGINT) AS [minActive]')
+                             ['minActive'].iloc[0])
+
+            # Cast rowVer (binary) to an integer, the binary column causes encoding errors
+            changed = 0
+            for chunk in self.iter_sql(f'SELECT *, CAST(rowVer AS BIGINT) AS [rowVerNum] FROM {table} '
+                                       'WHERE rowVer > CAST(CAST(? AS BIGINT) AS BINARY(8)) '
+                                       'AND rowVer < CAST(CAST(? AS BIGINT) AS BINARY(8))', [high_water, min_active]):
+                changed += self.replica.upsert(table, chunk.rename(columns={'rowVerNum': 'rowVer'}))
+
+            # Rows in the replica but not in MISys were deleted since the last sync
+            row_count = self.read_sql(f'SELECT COUNT(*) AS [rows] FROM {table}')['rows'].iloc[0]
+            if row_count != self.replica.count_rows(table):
+                self.replica.delete_missing(table, self.read_sql(f'SELECT {", ".join(key_cols)} FROM {table}'))
+
+        except Exception as e:
+            if info is None:
+                raise Exception(f'Cannot read {table} from DB or local replica!!') from e
+            warnings.warn(f'Could not sync {table} with DB ({e}), using local replica last synced '
+                          f'{self.replica.age(table):.2f} hours ago.')
+            return info['rows']
+
+        print(f'Synced {table}: {changed} new or changed rows')
+        return self.replica.set_synced(table, min_active - 1)['rows']
 
     def po_data_job_filter(self, df, jobs=None):
         """ Filters PO data DF by 'Job ID' with given list, or if none, prompts user. Returns filtered DF. """
@@ -100,8 +404,15 @@ class MisysTable:
                                          choices=df['Job ID'].sort_values().unique())
         return df.loc[df['Job ID'].isin(jobs)]
 
-    def load_po_data(self, filter_jobs=None):
-        df = self.fetch_po_data()
+    def load_po_data(self, filter_jobs=None, part_numbers=None):
+        """ Return PO line data with Product Number and Product Revision split from the item number
+
+        Args:
+            filter_jobs (list, optional): Job IDs to keep. If none given, the user is prompted to pick them.
+            part_numbers (list, optional): Only keep PO lines for these part numbers, ex. the Part Number column of
+                a processed BOM. Both filters are applied in the MISys query, so only those PO lines are fetched.
+        """
+        df = self.fetch_po_data(part_numbers=part_numbers, jobs=filter_jobs)
         # Join Item Number and Misc Item Number
         # df['Product Number'] = df['Item Number'].combine_first(df['Misc Item Number'])
         df.insert(7, 'Product Number', df['Item Number'].combine_first(df['Misc Item Number']))
@@ -116,8 +427,10 @@ class MisysTable:
         df['Qty Ordered'] = df['Qty Ordered'].astype('int64')
         df['Qty Recd'] = df['Qty Recd'].astype('int64')
 
-        # Filter by jobs
-        df = self.po_data_job_filter(df)
+        # Filter by parts (exact match, the query matched the start of the item number) and jobs
+        if part_numbers is not None:
+            df = df.loc[df['Product Number'].isin(part_numbers)]
+        df = self.po_data_job_filter(df, filter_jobs)
 
         return df
 
@@ -127,13 +440,21 @@ class MisysTable:
         return df
 
     def load_raw_po_df(self, row_limit=None):
-        """ Loads PO Line and PO Header tables in DF's, then does a pandas join. Slow than a SQL join, but don't
-        have to deal with conflicting header column names """
-        mipoh = misys.load_table('MIPOH')
-        mipod = misys.load_table('MIPOD', row_limit)
-        df = mipoh.join(mipod.set_index('pohId'), on='pohId', lsuffix='_mipod', rsuffix='_mipoh', how='right') \
-            .reset_index()
-        return df
+        """ Syncs the local replica of the PO Header and PO Line tables, then joins all their columns in SQLite. Header
+        and line columns with the same name get an _mipoh and _mipod suffix. Can limit number of PO lines. """
+        self.sync_po_replica()
+
+        header_cols = [col for col in self.replica.get_columns('MIPOH') if col not in ['pohId', 'rowVer']]
+        line_cols = [col for col in self.replica.get_columns('MIPOD') if col not in ['pohId', 'rowVer']]
+
+        columns = ['MIPOD.[pohId]'] \
+            + [f'MIPOH.[{col}] AS [{col}_mipoh]' if col in line_cols else f'MIPOH.[{col}]' for col in header_cols] \
+            + [f'MIPOD.[{col}] AS [{col}_mipod]' if col in header_cols else f'MIPOD.[{col}]' for col in line_cols]
+
+        limit = f' LIMIT {int(row_limit)}' if row_limit else ''
+        return self.read_replica_sql(f'SELECT {", ".join(columns)} FROM MIPOD '
+                                     'LEFT JOIN MIPOH ON MIPOH.pohId = MIPOD.pohId '
+                                     f'ORDER BY MIPOD.[pohId], MIPOD.[lineNbr]{limit}')
 
     def export_raw_po_df(self, file_name='raw_po_data.xlsx', row_limit=None):
         """ Dump raw PO line item data to XLSX with given name. Can also limit number of rows """
@@ -142,31 +463,19 @@ class MisysTable:
     def fix_pn(self, df):
         df.replace('', np.nan, regex=True, inplace=True)
 
-    def save_cache(self, df, cache_name):
-        cache_dir = f'./{self.cache_dir}'
-        if not os.path.exists(cache_dir):
-            os.mkdir(cache_dir)
-        cache_path = os.path.join(cache_dir, cache_name)
-        df.to_pickle(cache_path)
-
-    def read_cache(self, cache_name):
-        cache_path = f'{self.cache_dir}/{cache_name}'
-        if os.path.exists(cache_path):
-            return pd.read_pickle(cache_path)
-        else:
-            return None
+    def save_cache(self, df, cache_name, sql=None):
+        self.cache.save(cache_name, df, query=sql)
 
-    def check_for_cache(self, cache_name):
-        cache_path = f'{self.cache_dir}/{cache_name}'
-        return os.path.exists(cache_path)
+    def read_cache(self, cache_name, columns=None, sql=None):
+        """ Return cached DF, with only the given columns if any. None if not cached (for given SQL if any). """
+        return self.cache.load(cache_name, columns=columns, query=sql)
+
+    def check_for_cache(self, cache_name, sql=None):
+        return self.cache.get_info(cache_name, sql) is not None
 
     def cache_age(self, cache_name):
-        cache_path = f'{self.cache_dir}/{cache_name}'
-        if os.path.exists(cache_path):
-            cache_age = datetime.datetime.now() - datetime.datetime.fromtimestamp(os.path.getmtime(cache_path))
-            return cache_age.total_seconds() / (60 * 60)
-        else:
-            return 0
+        """ Return hours since the cached data was fetched from the DB, 0 if not cached """
+        return self.cache.age(cache_name) or 0
 
 
 def example():
@@ -0,0 +1,179 @@
+""" Module with an indexed local replica of MISys tables
+
+The replica is a SQLite database mirroring the MISys tables row for row, with indexes on the columns the PO data is
+joined and filtered on. MisysTable keeps it up to date with delta syncs (see MisysTable.sync_table), then runs the PO
+joins and filtered lookups against it locally instead of joining whole tables in pandas. Since it's on disk, it's also
+the data source when the MISys server is down.
+
+Text columns compare case-insensitively, like in the MISys DB, which also lets LIKE prefix matches use the indexes.
+
+    Typical usage example:
+    replica = MisysReplica()
+    replica.upsert('MIPOD', df)
+    replica.set_synced('MIPOD', high_water)
+    with contextlib.closing(replica.connect()) as cnxn:
+        df = pd.read_sql('SELECT * FROM MIPOD WHERE jobId = ?', cnxn, params=['J1234'])
+"""
+
+import datetime
+import os
+import sqlite3
+
+import pandas as pd
+import instrument
+
+# Tables kept in the replica, with their primary key columns. The primary keys also index the pohId joins.
+REPLICA_TABLES = {'MIPOH': ['pohId'],
+                  'MIPOD': ['pohId', 'lineNbr']}
+
+# Other indexed columns of each table, for the part number and job filters on the PO data
+REPLICA_INDEXES = {'MIPOD': ['itemId', 'viCode', 'jobId']}
+
+# SQLite column type for each pandas dtype kind, anything else is text. TIMESTAMP columns are read back as datetimes.
+COLUMN_TYPES = {'i': 'INTEGER',
+                'u': 'INTEGER',
+                'b': 'INTEGER',
+                'f': 'REAL',
+                'M': 'TIMESTAMP'}
+
+
+class MisysReplica:
+    """ Local SQLite copy of MISys tables, with the sync state of each
+
+        Attributes:
+            db_path: File path of SQLite database
+    """
+
+    def __init__(self, db_path='cache/misys/misys.db'):
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        with self.connect() as cnxn:
+            cnxn.execute('''
+                CREATE TABLE IF NOT EXISTS sync_state (
+                    table_name TEXT PRIMARY KEY,
+                    high_water INTEGER,
+                    synced TEXT)''')
+
+    def connect(self):
+        """ Return new connection to the replica DB """
+        # Long timeout since batch runs sync the replica from several processes
+        return sqlite3.connect(self.db_path, timeout=60, detect_types=sqlite3.PARSE_DECLTYPES)
+
+    def get_columns(self, table):
+        """ Return list of the column names of a replica table, empty if it doesn't exist yet """
+        with self.connect() as cnxn:
+            return self.__get_columns(cnxn, table)
+
+    def get_info(self, table):
+        """ Return dict with the sync state of a table: table, high_water (highest rowVer synced), synced (ISO time)
+        and rows. Returns None if the table was never synced. """
+        with self.connect() as cnxn:
+            state = cnxn.execute('SELECT high_water, synced FROM sync_state WHERE table_name = ?', (table,)).fetchone()
+            if state is None:
+                return None
+
+        return {'table': table, 'high_water': state[0], 'synced': state[1], 'rows': self.count_rows(table)}
+
+    def count_rows(self, table):
+        """ Return number of rows in a replica table, 0 if it doesn't exist yet """
+        if not self.get_columns(table):
+            return 0
+        with self.connect() as cnxn:
+            return cnxn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]
+
+    def is_synced(self, tables):
+        """ Return True if all of the given tables were synced at least once """
+        return all(self.get_info(table) is not None for table in tables)
+
+    def age(self, table):
+        """ Return hours since the table was last synced with MISys, None if never synced """
+        info = self.get_info(table)
+        if info is None:
+            return None
+        synced = datetime.datetime.fromisoformat(info['synced'])
+        return (datetime.datetime.now() - synced).total_seconds() / (60 * 60)
+
+    @instrument.timed('MisysReplica.upsert', rows_arg='df', detail_arg='table')
+    def upsert(self, table, df):
+        """ Insert the rows of DF into a replica table, replacing the rows with the same primary key. The table and its
+        indexes are created from the DF columns if it doesn't exist yet, and any new columns are added. Returns the
+        number of rows. """
+        with self.connect() as cnxn:
+            columns = self.__get_columns(cnxn, table)
+            if not columns:
+                self.__create_table(cnxn, table, df)
+            else:
+                for col_name in df.columns:
+                    if col_name not in columns:
+                        col_type = self.__get_column_type(df[col_name])
+                        cnxn.execute(f'ALTER TABLE {table} ADD COLUMN [{col_name}] {col_type}')
+
+            cnxn.executemany(f'INSERT OR REPLACE INTO {table} ({", ".join(f"[{col}]" for col in df.columns)}) '
+                             f'VALUES ({", ".join("?" * len(df.columns))})', self.__get_rows(df))
+
+        return len(df)
+
+    def delete_missing(self, table, keys):
+        """ Delete the rows of a replica table whose primary key isn't in the keys DF (ex. all keys of the MISys table,
+        to drop the rows deleted there). Returns the number of rows deleted. """
+        key_cols = REPLICA_TABLES[table]
+
+        with self.connect() as cnxn:
+            local_keys = pd.read_sql(f'SELECT {", ".join(key_cols)} FROM {table}', cnxn)
+            deleted = local_keys.merge(keys[key_cols].drop_duplicates(), on=key_cols, how='left', indicator=True)
+            deleted = deleted.loc[deleted['_merge'] == 'left_only', key_cols]
+
+            cnxn.executemany(f'DELETE FROM {table} WHERE {" AND ".join(f"{col} = ?" for col in key_cols)}',
+                             self.__get_rows(deleted))
+
+        return len(deleted)
+
+    def set_synced(self, table, high_water):
+        """ Record that a table was synced now, with every row up to the given rowVer, as the high water for the next
+        delta sync. Returns the new sync state, see get_info. """
+        with self.connect() as cnxn:
+            cnxn.execute('INSERT OR REPLACE INTO sync_state VALUES (?, ?, ?)',
+                         (table, int(high_water), datetime.datetime.now().isoformat(timespec='seconds')))
+        return self.get_info(table)
+
+    def drop(self, table):
+        """ Remove a table and its sync state from the replica """
+        with self.connect() as cnxn:
+            cnxn.execute(f'DROP TABLE IF EXISTS {table}')
+            cnxn.execute('DELETE FROM sync_state WHERE table_name = ?', (table,))
+
+    @staticmethod
+    def __get_columns(cnxn, table):
+        return [row[1] for row in cnxn.execute(f'PRAGMA table_info({table})')]
+
+    def __create_table(self, cnxn, table, df):
+        col_defs = [f'[{col_name}] {self.__get_column_type(df[col_name])}' for col_name in df.columns]
+        cnxn.execute(f'CREATE TABLE {table} ({", ".join(col_defs)}, '
+                     f'PRIMARY KEY ({", ".join(REPLICA_TABLES[table])}))')
+
+        for col_name in REPLICA_INDEXES.get(table, []):
+            if col_name in df.columns:
+                cnxn.execute(f'CREATE INDEX IF NOT EXISTS {table}_{col_name} ON {table} ([{col_name}])')
+
+    @staticmethod
+    def __get_column_type(col_series):
+        return COLUMN_TYPES.get(col_series.dtype.kind, 'TEXT COLLATE NOCASE')
+
+    @staticmethod
+    def __get_rows(df):
+        """ Return list of row tuples of DF, with values SQLite can store: Python numbers, strings and datetimes, and
+        None for nulls """
+        columns = []
+        for col_name in df.columns:
+            col_series = df[col_name]
+            if col_series.dtype.kind == 'M':
+                values = [None if pd.isnull(value) else value.to_pydatetime() for value in col_series]
+            else:
+                values = [None if pd.isnull(value) else value.item() if hasattr(value, 'item') else value
+                          for value in col_series.astype(object)]
+            columns.append(values)
+        return list(zip(*columns))
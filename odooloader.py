@@ -11,15 +11,18 @@ import pandas as pd
 import dfexporter
 from ast import literal_eval
 import dfexporter
+import instrument
 
 class OdooLoader():
 
+    @instrument.timed('OdooLoader.login')
     def __init__(self, srv=ODOO_URL, db=ODOO_DB, user=ODOO_USERNAME, pwd=ODOO_PASSWORD):
         self.api = odoorpc.ODOO(srv, protocol='jsonrpc+ssl', port=443)
         self.api.login(db, user, pwd)
         self.uid = self.api.env.uid
 
 
+    @instrument.timed('OdooLoader.search_by_field', rows=len, detail_arg='model')
     def search_by_field(self, model, search_field=None, search_string=None):
         Model = self.api.env[model]
         domain = [(search_field,'ilike',search_string)] if search_field else []
@@ -35,6 +38,7 @@ class OdooLoader():
     def get_raw_po_lines_df(self):
         return pd.DataFrame(self.search_by_field('purchase.order.line'))
 
+    @instrument.timed('OdooLoader.get_po_lines_df', rows=len)
     def get_po_lines_df(self, all_jobs=False):
 
         df = self.get_raw_po_lines_df()
@@ -0,0 +1,39 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+# Modules are at the top level of the repo, not in a package
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import bomloader  # noqa: E402
+
+
+@pytest.fixture
+def bom_csv(tmp_path):
+    """ Function that writes BOM lines, as (Level, Name, QTY, Description), to a PDM CSV file in tmp_path and returns
+    its path """
+
+    def write(lines, file_name='bom.csv'):
+        file_path = str(tmp_path / file_name)
+        df = pd.DataFrame([{'Level': level, 'Name': name, 'Configuration': 'Default', 'QTY': qty,
+                            'Description': description, 'Revision': 'A', 'State': 'Released', 'ID': num,
+                            'Latest Version': 1}
+                           for num, (level, name, qty, description) in enumerate(lines, 1)],
+                          columns=bomloader.BOM_CSV_COLUMNS)
+        df.to_csv(file_path, index=False, encoding='utf_16')
+        return file_path
+
+    return write
+
+
+@pytest.fixture
+def load_bom(bom_csv):
+    """ Function that writes BOM lines to a PDM CSV file (see bom_csv) and returns the loaded BOM. Any keyword
+    arguments are passed to BOM.load_csv. """
+
+    def load(lines, file_name='bom.csv', **kwargs):
+        return bomloader.BOM().load_csv(bom_csv(lines, file_name), **kwargs)
+
+    return load
@@ -0,0 +1,65 @@
+import os
+import sys
+
+import pandas as pd
+import pytest
+
+import bom_batch
+import bomloader
+
+BOM_LINES = [('1', '100F0001.SLDASM', 1, 'TOP ASSEMBLY'),
+             ('1.0', '100F0001.SLDDRW', 1, 'TOP ASSEMBLY'),
+             ('1.1', '110F0010.SLDASM', 2, 'SUB ASSEMBLY'),
+             ('1.1.1', '120F0020.SLDPRT', 3, 'PART'),
+             ('1.1.2', '120F0021.SLDPRT', 1, 'PART'),
+             ('1.2', '120F0021.SLDPRT', 4, 'PART')]
+
+
+@pytest.fixture
+def batch_run(tmp_path, monkeypatch):
+    """ Runs in tmp_path with Odoo PO data for one part, and records the keyword arguments of every load_csv """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(sys, 'argv', ['bom_batch.py'])
+    monkeypatch.setattr(bom_batch, '_worker_odoo_po_df', pd.DataFrame({
+        'PO Number': ['PO-1'], 'Supplier': ['ACME'], 'PO Line Number': [1], 'Status': ['purchase'], 'Job ID': ['J1'],
+        'Product Number': ['120F0021'], 'Product Revision': ['A'], 'Description': ['PART'], 'Qty Ordered': [4],
+        'Qty Recd': [0], 'Due Date': ['2021-01-01'], 'Unit Price': [2.0], 'Tax Price': [0.0], 'Total Price': [8.0]}))
+
+    load_calls = []
+    load_csv = bomloader.BOM.load_csv
+
+    def tracked_load_csv(self, *args, **kwargs):
+        load_calls.append(kwargs)
+        return load_csv(self, *args, **kwargs)
+
+    monkeypatch.setattr(bomloader.BOM, 'load_csv', tracked_load_csv)
+    return load_calls
+
+
+def read_sheets(output_dir):
+    return {file_name: pd.read_csv(os.path.join(output_dir, file_name)) for file_name in sorted(os.listdir(output_dir))}
+
+
+def test_streaming_output_matches(batch_run, bom_csv, tmp_path):
+    csv_file_path = bom_csv(BOM_LINES)
+
+    outputs = {}
+    for streaming in [False, True]:
+        output_dir = str(tmp_path / f'streaming_{streaming}')
+        result = bom_batch.process_file(csv_file_path, output_dir, use_cache=False, output_format='csv',
+                                        streaming=streaming)
+        assert result['Status'] == 'OK', result['Error']
+        outputs[streaming] = read_sheets(result['Output'])
+
+    assert [kwargs['streaming'] for kwargs in batch_run] == [False, True]
+    assert list(outputs[True]) == list(outputs[False])
+    for file_name, df in outputs[False].items():
+        pd.testing.assert_frame_equal(outputs[True][file_name], df)
+
+
+def test_streaming_option(batch_run, bom_csv, monkeypatch):
+    monkeypatch.setattr(sys, 'argv', ['bom_creator.py', '--streaming'])
+    result = bom_batch.process_file(bom_csv(BOM_LINES), use_cache=False, output_format='csv')
+
+    assert result['Status'] == 'OK', result['Error']
+    assert [kwargs['streaming'] for kwargs in batch_run] == [True]
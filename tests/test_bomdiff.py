@@ -0,0 +1,71 @@
+import pytest
+
+import bomdiff
+
+
+def bom_lines(descriptions, qtys=(1, 2)):
+    """ Assembly with two lines of the same part number, by default with different QTYs, each with its own child
+    part """
+    return [('1', '100F0001.SLDASM', 1, 'TOP ASSEMBLY'),
+            ('1.1', '123F0002.SLDASM', qtys[0], 'SUB ASSEMBLY'),
+            ('1.1.1', '123F0003.SLDPRT', 4, descriptions[0]),
+            ('1.2', '123F0002.SLDASM', qtys[1], 'SUB ASSEMBLY'),
+            ('1.2.1', '123F0004.SLDPRT', 6, descriptions[1])]
+
+
+@pytest.mark.parametrize('changed_line', [0, 1])
+@pytest.mark.parametrize('description', [f'NEW DESCRIPTION {num}' for num in range(8)])
+def test_same_part_number_siblings_stay_matched(load_bom, changed_line, description):
+    """ A change under one of two siblings with the same Part Number must not cross-match them """
+    old_descriptions = ['PART 3', 'PART 4']
+    new_descriptions = list(old_descriptions)
+    new_descriptions[changed_line] = description
+
+    old_bom = load_bom(bom_lines(old_descriptions), 'old.csv')
+    new_bom = load_bom(bom_lines(new_descriptions), 'new.csv')
+
+    changes_df = bomdiff.BOMDiff(old_bom, new_bom).changes_df
+
+    assert changes_df['Change'].tolist() == ['Changed']
+    assert changes_df['Details'].iloc[0] == f'Description: {old_descriptions[changed_line]} -> {description}'
+
+
+@pytest.mark.parametrize('changed_line', [0, 1])
+@pytest.mark.parametrize('description', [f'NEW DESCRIPTION {num}' for num in (1, 6, 7)])
+def test_equal_qty_siblings_stay_matched(load_bom, changed_line, description):
+    old_descriptions = ['PART 3', 'PART 4']
+    new_descriptions = list(old_descriptions)
+    new_descriptions[changed_line] = description
+
+    old_bom = load_bom(bom_lines(old_descriptions, qtys=(1, 1)), 'old.csv')
+    new_bom = load_bom(bom_lines(new_descriptions, qtys=(1, 1)), 'new.csv')
+
+    changes_df = bomdiff.BOMDiff(old_bom, new_bom).changes_df
+
+    assert changes_df['Change'].tolist() == ['Changed']
+    assert changes_df['Details'].iloc[0] == f'Description: {old_descriptions[changed_line]} -> {description}'
+
+
+@pytest.mark.parametrize('new_qty', [4, 6])
+def test_sibling_qty_change_is_a_changed_line(load_bom, new_qty):
+    """ A same Part Number sibling whose QTY changes is still matched to its old line, not the other sibling """
+    old_bom = load_bom(bom_lines(['PART 3', 'PART 4']), 'old.csv')
+    new_bom = load_bom(bom_lines(['PART 3', 'PART 4'], qtys=(new_qty, 2)), 'new.csv')
+
+    changes_df = bomdiff.BOMDiff(old_bom, new_bom).changes_df
+
+    assert changes_df['Change'].tolist() == ['Changed']
+    assert changes_df['Details'].iloc[0] == f'QTY: 1 -> {new_qty}'
+    assert changes_df['Part Number'].iloc[0] == '123F0002Default'
+
+
+def test_qty_change_is_a_changed_line(load_bom):
+    old_bom = load_bom(bom_lines(['PART 3', 'PART 4']), 'old.csv')
+    new_lines = bom_lines(['PART 3', 'PART 4'])
+    new_lines[2] = ('1.1.1', '123F0003.SLDPRT', 5, 'PART 3')
+    new_bom = load_bom(new_lines, 'new.csv')
+
+    changes_df = bomdiff.BOMDiff(old_bom, new_bom).changes_df
+
+    assert changes_df['Change'].tolist() == ['Changed']
+    assert changes_df['Details'].iloc[0] == 'QTY: 4 -> 5'
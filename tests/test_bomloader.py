@@ -0,0 +1,98 @@
+import json
+
+import pandas as pd
+import pytest
+
+import bomgen
+import bomloader
+
+
+def write_sparse_json(file_path, df, drop_keys=None):
+    """ Write BOM DataFrame as a PDM JSON BOM that leaves out null values, and any keys in drop_keys (dict of key to
+    number of leading lines to drop it from) """
+    drop_keys = drop_keys or {}
+    records = []
+    for num, record in enumerate(df.to_dict('records')):
+        records.append({key: value for key, value in record.items()
+                        if value is not None and value == value and num >= drop_keys.get(key, 0)})
+
+    with open(file_path, 'w') as f:
+        json.dump(records, f)
+    return file_path
+
+
+def test_json_keys_missing_from_first_lines(tmp_path):
+    df = bomgen.BOMGenerator(seed=1).generate_df(500)
+    file_path = write_sparse_json(str(tmp_path / 'bom.json'), df, drop_keys={'Finish 2': 150, 'Finish 3': len(df)})
+
+    bom = bomloader.BOM().load_csv(file_path, chunk_size=100)
+
+    expected_finishes = df['Finish 2'].iloc[150:].loc[df['Name'].str.endswith(('SLDPRT', 'SLDASM'))].dropna()
+    assert bom.df['Finish 2'].notnull().sum() == len(expected_finishes) > 0
+    assert bom.df['Finish 3'].isnull().all()
+
+
+def test_json_columns_match_csv(tmp_path):
+    df = bomgen.BOMGenerator(seed=2).generate_df(300)
+    csv_path = str(tmp_path / 'bom.csv')
+    df.to_csv(csv_path, index=False, encoding='utf_16')
+
+    csv_bom = bomloader.BOM().load_csv(csv_path, streaming=True)
+    json_bom = bomloader.BOM().load_csv(write_sparse_json(str(tmp_path / 'bom.json'), df), chunk_size=100)
+
+    assert json_bom.df.columns.tolist() == csv_bom.df.columns.tolist()
+
+
+def test_empty_json_array(tmp_path):
+    file_path = str(tmp_path / 'bom.json')
+    with open(file_path, 'w') as f:
+        f.write('[]')
+
+    with pytest.raises(RuntimeError, match='no lines'):
+        bomloader.BOM().load_csv(file_path)
+
+
+def test_sort_order_parent_id_and_total_qty(load_bom):
+    """ Small BOM with a drawing, repeated parts and more than 9 lines at one level """
+    bom = load_bom([('1', '100F0001.SLDASM', 1, 'TOP ASSEMBLY'),
+                    ('1.0', '100F0001.SLDDRW', 1, 'TOP ASSEMBLY'),
+                    ('1.1', '130F0030.SLDASM', 2, 'SUB ASSEMBLY'),
+                    ('1.1.1', '150F0052.SLDPRT', 3, 'PART'),
+                    ('1.1.2', '150F0051.SLDPRT', 1, 'PART'),
+                    ('1.2', '110F0010.SLDASM', 1, 'SUB ASSEMBLY'),
+                    ('1.2.1', '160F0061.SLDASM', 2, 'SUB ASSEMBLY'),
+                    ('1.2.1.1', '170F0071.SLDPRT', 4, 'PART'),
+                    ('1.3', '120F0020.SLDPRT', 5, 'PART'),
+                    ('1.4', '190F0009.SLDPRT', 1, 'PART'),
+                    ('1.5', '190F0008.SLDPRT', 1, 'PART'),
+                    ('1.6', '190F0007.SLDPRT', 1, 'PART'),
+                    ('1.7', '190F0006.SLDPRT', 1, 'PART'),
+                    ('1.8', '190F0005.SLDPRT', 1, 'PART'),
+                    ('1.9', '190F0004.SLDPRT', 1, 'PART'),
+                    ('1.10', '190F0003.SLDPRT', 2, 'PART'),
+                    ('1.11', '150F0051.SLDPRT', 3, 'PART')])
+
+    df = bom.get_df()
+    assert df['Level'].astype(str).tolist() == ['1', '1.1', '1.1.1', '1.1.1.1', '1.2', '1.3', '1.3.1', '1.3.2', '1.4',
+                                                '1.5', '1.6', '1.7', '1.8', '1.9', '1.10', '1.11']
+    assert df['Part Number'].tolist() == ['100F0001Default', '110F0010Default', '160F0061Default', '170F0071Default',
+                                          '120F0020Default', '130F0030Default', '150F0051Default', '150F0052Default',
+                                          '150F0051Default', '190F0003Default', '190F0004Default', '190F0005Default',
+                                          '190F0006Default', '190F0007Default', '190F0008Default', '190F0009Default']
+    assert df['Unique ID'].tolist() == [0, 5, 6, 7, 8, 2, 4, 3, 16, 15, 14, 13, 12, 11, 10, 9]
+    assert df['Parent ID'].isna().tolist() == [True] + [False] * 15
+    assert df['Parent ID'].iloc[1:].tolist() == [0, 5, 6, 0, 0, 2, 2, 0, 0, 0, 0, 0, 0, 0, 0]
+    assert df['Total QTY'].tolist() == [1, 1, 2, 8, 5, 2, 2, 6, 3, 2, 1, 1, 1, 1, 1, 1]
+
+
+def test_lazy_get_df_matches_full_load(load_bom):
+    lines = [('1', '100F0001.SLDASM', 1, 'TOP ASSEMBLY'),
+             ('1.1', '110F0010.SLDASM', 2, 'SUB ASSEMBLY'),
+             ('1.1.1', '120F0020.SLDPRT', 3, 'PART'),
+             ('1.2', '120F0020.SLDPRT', 4, 'PART')]
+    full_df = load_bom(lines).df
+    lazy_bom = load_bom(lines, lazy=True)
+
+    columns = ['Part Number', 'Used On', 'Level', 'QTY', 'Total QTY']
+    pd.testing.assert_frame_equal(lazy_bom.get_df(columns), full_df[columns])
+    pd.testing.assert_frame_equal(lazy_bom.df, full_df)
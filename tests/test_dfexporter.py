@@ -0,0 +1,38 @@
+import pandas as pd
+import pytest
+
+import dfexporter
+
+openpyxl = pytest.importorskip('openpyxl')
+
+
+def test_add_sheet_values_formats_and_outline(tmp_path):
+    file_path = str(tmp_path / 'output.xlsx')
+    df = pd.DataFrame({'Depth': [0, 1, 2, 1],
+                       'Part Number': ['100F0001', '110F0010', '120F0020', None],
+                       'QTY': pd.array([1, 2, 3, None], dtype='Int64'),
+                       'Weight': [1.5, 0.25, None, 2.0]})
+
+    exporter = dfexporter.DFExport(file_path)
+    exporter.add_sheet(df, 'BOM', depth_col_name='Depth', cols_to_indent=['Part Number'], highlight_depth=True,
+                       highlight_col_limit=3, group_rows=True, print_index=False)
+    exporter.write_book()
+
+    sheet = openpyxl.load_workbook(file_path)['BOM']
+
+    assert [[cell.value for cell in row] for row in sheet.iter_rows()] == [['Depth', 'Part Number', 'QTY', 'Weight'],
+                                                                            [0, '100F0001', 1, 1.5],
+                                                                            [1, '110F0010', 2, 0.25],
+                                                                            [2, '120F0020', 3, None],
+                                                                            [1, None, None, 2]]
+
+    # Part Number is indented by depth, the first 3 columns are highlighted by depth and Weight is a float
+    assert [sheet.cell(row, 2).alignment.indent for row in range(2, 6)] == [0, 1, 2, 1]
+    assert [sheet.cell(row, 1).fill.fgColor.rgb for row in range(2, 6)] == ['FF464646', 'FF595859', 'FF777677',
+                                                                            'FF595859']
+    assert sheet.cell(2, 4).fill.fgColor.rgb != 'FF464646'
+    assert sheet.cell(2, 4).number_format == '0.00000'
+    assert sheet.cell(1, 1).alignment.textRotation == 90
+
+    # Rows are grouped by depth
+    assert [sheet.row_dimensions[row].outline_level for row in range(2, 6)] == [0, 1, 2, 1]
@@ -0,0 +1,162 @@
+import contextlib
+import sqlite3
+
+import pandas as pd
+import pytest
+
+import misysloader
+
+
+class TrackedConnection(sqlite3.Connection):
+    """ SQLite connection that records when it's closed """
+
+    def close(self):
+        self.closed = True
+        super().close()
+
+
+@pytest.fixture
+def misys_db(tmp_path, monkeypatch):
+    """ SQLite stand-in for the MISys DB with small MIPOH and MIPOD tables, with rowVer 1 to 30. Runs in tmp_path so
+    the cache and replica are written there. MIN_ACTIVE_ROWVERSION() returns the connection factory's
+    min_active_rowversion attribute. """
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(misysloader, '_connection_pool', {})
+
+    db_path = str(tmp_path / 'misys.db')
+    with sqlite3.connect(db_path) as cnxn:
+        pd.DataFrame({'pohId': [f'P{num:04d}' for num in range(5)],
+                      'name': ['ACME', 'BOLT CO', '', 'ACME', None],
+                      'rowVer': range(1, 6)}).to_sql('MIPOH', cnxn, index=False)
+        pd.DataFrame({'pohId': [f'P{num // 5:04d}' for num in range(25)],
+                      'lineNbr': [num % 5 + 1 for num in range(25)],
+                      'jobId': [['J100', 'J200', ''][num % 3] for num in range(25)],
+                      'itemId': [f'123F{num:04d}' if num % 4 else '' for num in range(25)],
+                      'ordered': [num % 7 + 1 for num in range(25)],
+                      'price': [num * 1.25 for num in range(25)],
+                      'rowVer': range(6, 31)}).to_sql('MIPOD', cnxn, index=False)
+
+    connections = []
+
+    def connection_factory():
+        connections.append(sqlite3.connect(db_path, factory=TrackedConnection))
+        connections[-1].create_function('MIN_ACTIVE_ROWVERSION', 0, lambda: connection_factory.min_active_rowversion)
+        return connections[-1]
+
+    connection_factory.min_active_rowversion = 31
+    return connection_factory, connections
+
+
+SQL = ('SELECT MIPOD.*, MIPOH.name FROM MIPOD LEFT JOIN MIPOH ON MIPOH.pohId = MIPOD.pohId '
+       'ORDER BY MIPOD.pohId, MIPOD.lineNbr')
+
+
+def test_chunked_load_matches_single_fetch(misys_db):
+    connection_factory, _ = misys_db
+    single_df = misysloader.MisysTable(connection_factory=connection_factory).read_sql(SQL)
+
+    misys = misysloader.MisysTable(connection_factory=connection_factory, fetch_chunk_size=7)
+    assert len(list(misys.iter_sql(SQL))) == 4
+
+    chunked_df = misys.load_sql(SQL, 'PO_TABLE')
+    pd.testing.assert_frame_equal(chunked_df, single_df)
+    assert len(chunked_df) == 25
+
+    # Read back from cache the second time
+    pd.testing.assert_frame_equal(misys.load_sql(SQL, 'PO_TABLE'), single_df)
+
+
+def test_connections_are_reused(misys_db):
+    connection_factory, connections = misys_db
+    misys = misysloader.MisysTable(connection_factory=connection_factory, fetch_chunk_size=7)
+
+    misys.read_sql(SQL)
+    misys.read_sql('SELECT COUNT(*) AS rows FROM MIPOH')
+
+    # Stopping part way through the results is not an error, the connection is still reused
+    chunks = misys.iter_sql(SQL)
+    next(chunks)
+    chunks.close()
+
+    assert len(connections) == 1
+    assert not getattr(connections[0], 'closed', False)
+    assert len(misys.read_sql(SQL)) == 25
+
+
+def test_connection_closed_after_error(misys_db):
+    connection_factory, connections = misys_db
+    misys = misysloader.MisysTable(connection_factory=connection_factory)
+
+    misys.read_sql(SQL)
+    with pytest.raises(sqlite3.OperationalError):
+        misys.read_sql('SELECT * FROM NOT_A_TABLE')
+
+    assert len(connections) == 1
+    assert connections[0].closed
+
+    # The broken connection isn't given out again
+    assert len(misys.read_sql(SQL)) == 25
+    assert len(connections) == 2
+
+
+def test_text_column_empty_in_first_chunk(misys_db, tmp_path):
+    """ A text column with no values in the first chunk is still saved as text, so later chunks with values fit """
+    connection_factory, _ = misys_db
+    with sqlite3.connect(str(tmp_path / 'misys.db')) as cnxn:
+        pd.DataFrame({'lineNbr': range(20), 'note': [''] * 10 + ['note'] * 10}).to_sql('MIPOC', cnxn, index=False)
+
+    misys = misysloader.MisysTable(connection_factory=connection_factory, fetch_chunk_size=5)
+    df = misys.load_sql('SELECT * FROM MIPOC ORDER BY lineNbr', 'NOTE_TABLE')
+
+    assert df['note'].isna().sum() == 10
+    assert df['note'].iloc[10:].tolist() == ['note'] * 10
+
+
+def write_misys(tmp_path, sql, params=()):
+    with sqlite3.connect(str(tmp_path / 'misys.db')) as cnxn:
+        cnxn.execute(sql, params)
+
+
+def read_replica(misys, table):
+    with contextlib.closing(misys.replica.connect()) as cnxn:
+        return pd.read_sql(f'SELECT * FROM {table} ORDER BY pohId, lineNbr', cnxn)
+
+
+def test_sync_inserts_updates_and_deletes(misys_db, tmp_path):
+    connection_factory, _ = misys_db
+    misys = misysloader.MisysTable(connection_factory=connection_factory, fetch_chunk_size=7)
+    assert misys.sync_table('MIPOD') == 25
+    assert misys.replica.get_info('MIPOD')['high_water'] == 30
+
+    write_misys(tmp_path, "UPDATE MIPOD SET ordered = 99, rowVer = 31 WHERE pohId = 'P0001' AND lineNbr = 2")
+    write_misys(tmp_path, "INSERT INTO MIPOD VALUES ('P0005', 1, 'J300', '123F0100', 3, 9.5, 32)")
+    write_misys(tmp_path, "DELETE FROM MIPOD WHERE pohId = 'P0002' AND lineNbr = 4")
+    connection_factory.min_active_rowversion = 33
+    assert misys.sync_table('MIPOD') == 25
+    assert misys.replica.get_info('MIPOD')['high_water'] == 32
+
+    replica_df = read_replica(misys, 'MIPOD').set_index(['pohId', 'lineNbr'])
+    assert replica_df.loc[('P0001', 2), 'ordered'] == 99
+    assert replica_df.loc[('P0005', 1), 'jobId'] == 'J300'
+    assert ('P0002', 4) not in replica_df.index
+    assert replica_df['rowVer'].max() == 32
+
+
+def test_sync_waits_for_open_transactions(misys_db, tmp_path):
+    """ A row committed with rowVer 32 while rowVer 31 is still in an open transaction must not move the high water
+    past 31, or row 31 would be missed once it commits """
+    connection_factory, _ = misys_db
+    misys = misysloader.MisysTable(connection_factory=connection_factory)
+    misys.sync_table('MIPOD')
+
+    write_misys(tmp_path, "INSERT INTO MIPOD VALUES ('P0005', 2, 'J300', '123F0102', 1, 2.5, 32)")
+    connection_factory.min_active_rowversion = 31
+    misys.sync_table('MIPOD')
+    assert misys.replica.get_info('MIPOD')['high_water'] == 30
+
+    write_misys(tmp_path, "INSERT INTO MIPOD VALUES ('P0005', 1, 'J300', '123F0101', 1, 2.5, 31)")
+    connection_factory.min_active_rowversion = 33
+    assert misys.sync_table('MIPOD') == 27
+
+    replica_df = read_replica(misys, 'MIPOD')
+    assert replica_df.loc[replica_df['pohId'] == 'P0005', 'itemId'].tolist() == ['123F0101', '123F0102']
@@ -0,0 +1,127 @@
+""" Module with a persistent where-used index across all processed BOMs
+
+Every processed BOM adds its lines to a SQLite database indexed by Part Number, so "which assemblies use part X?"
+can be answered without re-running any BOMs. Re-processing an assembly replaces its lines in the index.
+
+    Typical usage example:
+    python whereused.py 123F4567-1 123F4567-2
+"""
+
+import argparse
+import datetime
+import os
+import sqlite3
+
+import pandas as pd
+import instrument
+
+
+class WhereUsedIndex:
+    """ Inverted index from Part Number to the assemblies, parents and quantities it is used on
+
+        Attributes:
+            db_path: File path of SQLite database
+    """
+
+    def __init__(self, db_path='cache/where_used.db'):
+        self.db_path = db_path
+
+        db_dir = os.path.dirname(self.db_path)
+        if db_dir and not os.path.exists(db_dir):
+            os.makedirs(db_dir)
+
+        with self.__connect() as cnxn:
+            cnxn.executescript('''
+                CREATE TABLE IF NOT EXISTS assemblies (
+                    assembly TEXT PRIMARY KEY,
+                    file_path TEXT,
+                    updated TEXT);
+                CREATE TABLE IF NOT EXISTS where_used (
+                    part_number TEXT,
+                    assembly TEXT,
+                    parent TEXT,
+                    level TEXT,
+                    qty INTEGER,
+                    total_qty INTEGER);
+                CREATE INDEX IF NOT EXISTS where_used_part_number ON where_used (part_number);
+                CREATE INDEX IF NOT EXISTS where_used_assembly ON where_used (assembly);''')
+
+    def __connect(self):
+        # Long timeout since batch runs update the index from several processes
+        return sqlite3.connect(self.db_path, timeout=60)
+
+    @instrument.timed('WhereUsedIndex.update')
+    def update(self, bom, assembly=None):
+        """ Replace the index lines for the assembly of given BOM object
+
+        Args:
+            bom (BOM): Processed BOM object
+            assembly (str, optional): Assembly name to index the BOM under. Defaults to the assembly number from the
+                BOM file name.
+        """
+        if assembly is None:
+            assembly = bom.get_assy_from_file()
+
+        # Only computes the derived columns needed if the BOM was loaded with lazy=True
+        lines = bom.get_df(['Part Number', 'Used On', 'Level', 'QTY', 'Total QTY']).astype(object)
+        lines = lines.where(lines.notnull(), None)
+        rows = [(pn, assembly, parent, None if level is None else str(level),
+                 None if qty is None else int(qty), None if total_qty is None else int(total_qty))
+                for pn, parent, level, qty, total_qty in lines.itertuples(index=False)]
+
+        with self.__connect() as cnxn:
+            cnxn.execute('DELETE FROM where_used WHERE assembly = ?', (assembly,))
+            cnxn.executemany('INSERT INTO where_used VALUES (?, ?, ?, ?, ?, ?)', rows)
+            cnxn.execute('INSERT OR REPLACE INTO assemblies VALUES (?, ?, ?)',
+                         (assembly, bom.file_path, datetime.datetime.now().isoformat(timespec='seconds')))
+
+    def remove(self, assembly):
+        """ Remove an assembly from the index """
+        with self.__connect() as cnxn:
+            cnxn.execute('DELETE FROM where_used WHERE assembly = ?', (assembly,))
+            cnxn.execute('DELETE FROM assemblies WHERE assembly = ?', (assembly,))
+
+    def query(self, part_numbers):
+        """ Return DataFrame of every line using given part number(s), with its assembly, parent and quantities """
+        if isinstance(part_numbers, str):
+            part_numbers = [part_numbers]
+
+        sql = ('SELECT part_number AS [Part Number], assembly AS Assembly, parent AS [Used On], level AS Level, '
+               'qty AS QTY, total_qty AS [Total QTY] FROM where_used '
+               f'WHERE part_number IN ({", ".join("?" * len(part_numbers))}) '
+               'ORDER BY part_number, assembly, level')
+
+        with self.__connect() as cnxn:
+            return pd.read_sql(sql, cnxn, params=list(part_numbers))
+
+    def query_assemblies(self, part_numbers):
+        """ Return DataFrame with the total quantity of given part number(s) in each top level assembly """
+        df = self.query(part_numbers)
+        return df.groupby(['Part Number', 'Assembly'], as_index=False)['Total QTY'].sum()
+
+    def get_assemblies_df(self):
+        """ Return DataFrame of the indexed assemblies and when they were last updated """
+        with self.__connect() as cnxn:
+            return pd.read_sql('SELECT assembly AS Assembly, file_path AS [File Path], updated AS Updated '
+                               'FROM assemblies ORDER BY assembly', cnxn)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Find which assemblies use a part number')
+    parser.add_argument('part_numbers', nargs='*')
+    parser.add_argument('--db', default='cache/where_used.db')
+    parser.add_argument('--lines', action='store_true', help='Show every line instead of totals per assembly')
+    args = parser.parse_args()
+
+    index = WhereUsedIndex(args.db)
+
+    if not args.part_numbers:
+        print(index.get_assemblies_df().to_string(index=False))
+    elif args.lines:
+        print(index.query(args.part_numbers).to_string(index=False))
+    else:
+        print(index.query_assemblies(args.part_numbers).to_string(index=False))
+
+
+if __name__ == '__main__':
+    main()